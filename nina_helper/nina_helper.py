@@ -1,10 +1,122 @@
 """Utility functions to help with working with NinaPro database."""
 
+import argparse
+import json
 import os
+import shutil
+import timeit
+from collections import OrderedDict
 import numpy as np
 import scipy.io as sio
-from sklearn.preprocessing import StandardScaler
+from scipy.signal import get_window
+from numpy.lib.stride_tricks import as_strided
 from itertools import combinations, chain
+from multiprocessing import Pool
+
+try:
+    import numba
+except ImportError:  # Optional accelerated backend, the NumPy implementations are used without it
+    numba = None
+
+# Storage precision shared by import, normalisation and windowing (None: keep data as loaded)
+_precision = {'dtype': None}
+
+# Implementation used for the hot loops: 'numpy' unless JIT-compiled kernels are chosen with set_backend('numba')
+_backend = {'name': 'numpy'}
+_compiled_kernels = {}
+
+# Per-subject group moments kept by normalise_emg when given a cache_key (least recently used dropped first)
+_moment_cache = OrderedDict()
+_MOMENT_CACHE_SIZE = 8
+
+# Supported memory layouts for windowed data: N windows, T time steps, C channels
+_LAYOUTS = ('NTC1', 'NTC', 'NCT', 'flat')
+
+# Row type of the segment table: one row per run of constant repetition and movement (end inclusive)
+SEGMENT_DTYPE = np.dtype([('start', np.int64),
+                          ('end', np.int64),
+                          ('rep', np.int8),
+                          ('move', np.int8),
+                          ('capped', np.bool_),
+                          ('exercise', np.int8)])
+
+# Tapers applied before the FFT of spectral features, keyed by (name, window_len)
+_taper_cache = {}
+
+# Ways of labelling a window from the movement labels it covers
+_LABELS = ('end', 'majority', 'pure')
+
+# Number of observations processed at a time when computing/applying normalisation statistics
+_CHUNK_SIZE = 2 ** 16
+
+
+def set_precision(dtype):
+    """Set the storage precision used across the load-normalise-window pipeline.
+
+    Statistics are always accumulated in float64, only storage uses the chosen precision.
+
+    Args:
+        dtype (TYPE): Floating point type to store EMG data as (e.g. np.float32, np.float16) or None to keep the
+            precision data is loaded with
+    """
+    if dtype is not None:
+        dtype = np.dtype(dtype)
+        if dtype.kind != 'f':
+            raise ValueError('precision should be a floating point type')
+
+    _precision['dtype'] = dtype
+
+
+def get_precision():
+    """Return the storage precision used across the load-normalise-window pipeline.
+
+    Returns:
+        TYPE: Current floating point type or None if data is kept as loaded
+    """
+    return _precision['dtype']
+
+
+def set_backend(name):
+    """Choose the implementation used for the hot loops (repetition relabelling), 'numpy' by default.
+
+    Args:
+        name (str): 'numba' for JIT-compiled kernels (requires numba) or 'numpy'
+    """
+    if name not in ('numba', 'numpy'):
+        raise ValueError('backend should be either numba or numpy')
+    if name == 'numba' and numba is None:
+        raise ValueError('numba backend requested but numba is not installed')
+
+    _backend['name'] = name
+
+
+def get_backend():
+    """Return the implementation used for the hot loops.
+
+    Returns:
+        str: 'numba' or 'numpy'
+    """
+    return _backend['name']
+
+
+def _kernel(func):
+    """JIT-compiled func (compilation cached on disk) when the numba backend is active, func itself otherwise."""
+    if _backend['name'] != 'numba':
+        return func
+    if func not in _compiled_kernels:
+        _compiled_kernels[func] = numba.njit(cache=True, nogil=True)(func)
+    return _compiled_kernels[func]
+
+
+def _resolve_dtype(dtype, default=None):
+    """Pick an explicit dtype, falling back to the pipeline precision then to default."""
+    if dtype is not None:
+        return np.dtype(dtype)
+    if _precision['dtype'] is not None:
+        return _precision['dtype']
+    if default is not None:
+        return np.dtype(default)
+    return None
 
 
 def db1_info():
@@ -130,89 +242,20 @@ def db2_info():
             }
 
 
-def import_db1(folder_path, subject, rest_length_cap=999):
+def import_db1(folder_path, subject, rest_length_cap=999, dtype=None):
     """Function for extracting data from raw NinaiPro files for DB1.
 
     Args:
         folder_path (string): Path to folder containing raw mat files
         subject (int): 1-27 which subject's data to import
         rest_length_cap (int, optional): The number of seconds of rest data to keep before/after a movement
+        dtype (TYPE, optional): What precision to store EMG data in - if None use the pipeline precision
 
     Returns:
         Dictionary: Raw EMG data, corresponding repetition and movement labels, indices of where repetitions are
-            demarked and the number of repetitions with capped off rest data
+            demarked, the number of repetitions with capped off rest data and the segment table (see get_segments)
     """
-    fs = 100
-
-    cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_A1_E1.mat')
-    data = sio.loadmat(cur_path)
-    emg = np.squeeze(np.array(data['emg']))
-    rep = np.squeeze(np.array(data['rerepetition']))
-    move = np.squeeze(np.array(data['restimulus']))
-
-    cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_A1_E2.mat')
-    data = sio.loadmat(cur_path)
-    emg = np.vstack((emg, np.array(data['emg'])))
-    rep = np.append(rep, np.squeeze(np.array(data['rerepetition'])))
-    move_tmp = np.squeeze(np.array(data['restimulus']))  # Fix for numbering
-    move_tmp[move_tmp != 0] += max(move)
-    move = np.append(move, move_tmp)
-
-    cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_A1_E3.mat')
-    data = sio.loadmat(cur_path)
-    emg = np.vstack((emg, np.array(data['emg'])))
-    rep = np.append(rep, np.squeeze(np.array(data['rerepetition'])))
-    move_tmp = np.squeeze(np.array(data['restimulus']))  # Fix for numbering
-    move_tmp[move_tmp != 0] += max(move)
-    move = np.append(move, move_tmp)
-
-    move = move.astype('int8')  # To minimise overhead
-
-    # Label repetitions using new block style: rest-move-rest regions
-    move_regions = np.where(np.diff(move))[0]
-    rep_regions = np.zeros((move_regions.shape[0],), dtype=int)
-    nb_reps = int(round(move_regions.shape[0] / 2))
-    last_end_idx = int(round(move_regions[0] / 2))
-    nb_unique_reps = np.unique(rep).shape[0] - 1  # To account for 0 regions
-    nb_capped = 0
-    cur_rep = 1
-
-    rep = np.zeros([rep.shape[0], ], dtype=np.int8)  # Reset rep array
-    for i in range(nb_reps - 1):
-        rep_regions[2 * i] = last_end_idx
-        midpoint_idx = int(round((move_regions[2 * (i + 1) - 1] +
-                                  move_regions[2 * (i + 1)]) / 2)) + 1
-
-        trailing_rest_samps = midpoint_idx - move_regions[2 * (i + 1) - 1]
-        if trailing_rest_samps <= rest_length_cap * fs:
-            rep[last_end_idx:midpoint_idx] = cur_rep
-            last_end_idx = midpoint_idx
-            rep_regions[2 * i + 1] = midpoint_idx - 1
-
-        else:
-            rep_end_idx = (move_regions[2 * (i + 1) - 1] +
-                           int(round(rest_length_cap * fs)))
-            rep[last_end_idx:rep_end_idx] = cur_rep
-            last_end_idx = ((move_regions[2 * (i + 1)] -
-                             int(round(rest_length_cap * fs))))
-            rep_regions[2 * i + 1] = rep_end_idx - 1
-            nb_capped += 2
-
-        cur_rep += 1
-        if cur_rep > nb_unique_reps:
-            cur_rep = 1
-
-    end_idx = int(round((emg.shape[0] + move_regions[-1]) / 2))
-    rep[last_end_idx:end_idx] = cur_rep
-    rep_regions[-2] = last_end_idx
-    rep_regions[-1] = end_idx - 1
-
-    return {'emg': emg,
-            'rep': rep,
-            'move': move,
-            'rep_regions': rep_regions,
-            'nb_capped': nb_capped
-            }
+    return import_subject(folder_path, subject, 1, rest_length_cap, dtype)
 
 
 def import_db1_unrefined(folder_path, subject, rest_length_cap=999):
@@ -252,42 +295,8 @@ def import_db1_unrefined(folder_path, subject, rest_length_cap=999):
 
     # Label repetitions using new block style: rest-move-rest regions
     move_regions = np.where(np.diff(move))[0]
-    rep_regions = np.zeros((move_regions.shape[0],), dtype=int)
-    nb_reps = int(round(move_regions.shape[0] / 2))
-    last_end_idx = int(round(move_regions[0] / 2))
     nb_unique_reps = np.unique(rep).shape[0] - 1  # To account for 0 regions
-    nb_capped = 0
-    cur_rep = 1
-
-    rep = np.zeros([rep.shape[0], ], dtype=np.int8)  # Reset rep array
-    for i in range(nb_reps - 1):
-        rep_regions[2 * i] = last_end_idx
-        midpoint_idx = int(round((move_regions[2 * (i + 1) - 1] +
-                                  move_regions[2 * (i + 1)]) / 2)) + 1
-
-        trailing_rest_samps = midpoint_idx - move_regions[2 * (i + 1) - 1]
-        if trailing_rest_samps <= rest_length_cap * fs:
-            rep[last_end_idx:midpoint_idx] = cur_rep
-            last_end_idx = midpoint_idx
-            rep_regions[2 * i + 1] = midpoint_idx - 1
-
-        else:
-            rep_end_idx = (move_regions[2 * (i + 1) - 1] +
-                           int(round(rest_length_cap * fs)))
-            rep[last_end_idx:rep_end_idx] = cur_rep
-            last_end_idx = ((move_regions[2 * (i + 1)] -
-                             int(round(rest_length_cap * fs))))
-            rep_regions[2 * i + 1] = rep_end_idx - 1
-            nb_capped += 2
-
-        cur_rep += 1
-        if cur_rep > nb_unique_reps:
-            cur_rep = 1
-
-    end_idx = int(round((rep.shape[0] + move_regions[-1]) / 2))
-    rep[last_end_idx:end_idx] = cur_rep
-    rep_regions[-2] = last_end_idx
-    rep_regions[-1] = end_idx - 1
+    rep, rep_regions, nb_capped, _ = _refine_reps(rep.shape[0], move_regions, nb_unique_reps, fs, rest_length_cap)
 
     return {'rep': rep,
             'move': move,
@@ -296,103 +305,23 @@ def import_db1_unrefined(folder_path, subject, rest_length_cap=999):
             }
 
 
-def import_db2(folder_path, subject, rest_length_cap=999):
+def import_db2(folder_path, subject, rest_length_cap=999, dtype=None):
     """Function for extracting data from raw NinaiPro files for DB2.
 
     Args:
         folder_path (string): Path to folder containing raw mat files
         subject (int): 1-40 which subject's data to import
         rest_length_cap (int, optional): The number of seconds of rest data to keep before/after a movement
+        dtype (TYPE, optional): What precision to store EMG data in - if None use the pipeline precision
 
     Returns:
         Dictionary: Raw EMG data, corresponding repetition and movement labels, indices of where repetitions are
-            demarked and the number of repetitions with capped off rest data
+            demarked, the number of repetitions with capped off rest data and the segment table (see get_segments)
 
     Note:
         Last 9 "movements" are actually force exercises
     """
-    fs = 2000
-
-    cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E1_A1.mat')
-    data = sio.loadmat(cur_path)
-    emg = np.squeeze(np.array(data['emg']))
-    rep = np.squeeze(np.array(data['rerepetition']))
-    move = np.squeeze(np.array(data['restimulus']))
-
-    cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E2_A1.mat')
-    data = sio.loadmat(cur_path)
-    emg = np.vstack((emg, np.array(data['emg'])))
-    rep = np.append(rep, np.squeeze(np.array(data['rerepetition'])))
-    move_tmp = np.squeeze(np.array(data['restimulus']))
-    move = np.append(move, move_tmp)  # Note no fix needed for this exercise
-
-    cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E3_A1.mat')
-    data = sio.loadmat(cur_path)
-    emg = np.vstack((emg, np.array(data['emg'])))
-    data['repetition'][-1] = 0  # Fix for diffing
-    rep = np.append(rep, np.squeeze(np.array(data['repetition'])))
-
-    # Movements number in non-logical pattern [0  1  2  4  6  8  9 16 32 40]
-    # Also note that for last file there is no 'rerepetition or 'restimulus'
-    data['stimulus'][-1] = 0  # Fix for diffing
-    data['stimulus'][np.where(data['stimulus'] == 1)] = 41
-    data['stimulus'][np.where(data['stimulus'] == 2)] = 42
-    data['stimulus'][np.where(data['stimulus'] == 4)] = 43
-    data['stimulus'][np.where(data['stimulus'] == 6)] = 44
-    data['stimulus'][np.where(data['stimulus'] == 8)] = 45
-    data['stimulus'][np.where(data['stimulus'] == 9)] = 46
-    data['stimulus'][np.where(data['stimulus'] == 16)] = 47
-    data['stimulus'][np.where(data['stimulus'] == 32)] = 48
-    data['stimulus'][np.where(data['stimulus'] == 40)] = 49
-    move_tmp = np.squeeze(np.array(data['stimulus']))
-    move = np.append(move, move_tmp)
-
-    move = move.astype('int8')  # To minimise overhead
-
-    # Label repetitions using new block style: rest-move-rest regions
-    move_regions = np.where(np.diff(move))[0]
-    rep_regions = np.zeros((move_regions.shape[0],), dtype=int)
-    nb_reps = int(round(move_regions.shape[0] / 2))
-    last_end_idx = int(round(move_regions[0] / 2))
-    nb_unique_reps = np.unique(rep).shape[0] - 1  # To account for 0 regions
-    nb_capped = 0
-    cur_rep = 1
-
-    rep = np.zeros([rep.shape[0], ], dtype=np.int8)  # Reset rep array
-    for i in range(nb_reps - 1):
-        rep_regions[2 * i] = last_end_idx
-        midpoint_idx = int(round((move_regions[2 * (i + 1) - 1] +
-                                  move_regions[2 * (i + 1)]) / 2)) + 1
-
-        trailing_rest_samps = midpoint_idx - move_regions[2 * (i + 1) - 1]
-        if trailing_rest_samps <= rest_length_cap * fs:
-            rep[last_end_idx:midpoint_idx] = cur_rep
-            last_end_idx = midpoint_idx
-            rep_regions[2 * i + 1] = midpoint_idx - 1
-        else:
-            rep_end_idx = (move_regions[2 * (i + 1) - 1] +
-                           int(round(rest_length_cap * fs)))
-            rep[last_end_idx:rep_end_idx] = cur_rep
-            last_end_idx = ((move_regions[2 * (i + 1)] -
-                             int(round(rest_length_cap * fs))))
-            rep_regions[2 * i + 1] = rep_end_idx - 1
-            nb_capped += 2
-
-        cur_rep += 1
-        if cur_rep > nb_unique_reps:
-            cur_rep = 1
-
-    end_idx = int(round((emg.shape[0] + move_regions[-1]) / 2))
-    rep[last_end_idx:end_idx] = cur_rep
-    rep_regions[-2] = last_end_idx
-    rep_regions[-1] = end_idx - 1
-
-    return {'emg': emg,
-            'rep': rep,
-            'move': move,
-            'rep_regions': rep_regions,
-            'nb_capped': nb_capped
-            }
+    return import_subject(folder_path, subject, 2, rest_length_cap, dtype)
 
 
 def import_db2_unrefined(folder_path, subject, rest_length_cap=999):
@@ -443,41 +372,8 @@ def import_db2_unrefined(folder_path, subject, rest_length_cap=999):
 
     # Label repetitions using new block style: rest-move-rest regions
     move_regions = np.where(np.diff(move))[0]
-    rep_regions = np.zeros((move_regions.shape[0],), dtype=int)
-    nb_reps = int(round(move_regions.shape[0] / 2))
-    last_end_idx = int(round(move_regions[0] / 2))
     nb_unique_reps = np.unique(rep).shape[0] - 1  # To account for 0 regions
-    nb_capped = 0
-    cur_rep = 1
-
-    rep = np.zeros([rep.shape[0], ], dtype=np.int8)  # Reset rep array
-    for i in range(nb_reps - 1):
-        rep_regions[2 * i] = last_end_idx
-        midpoint_idx = int(round((move_regions[2 * (i + 1) - 1] +
-                                  move_regions[2 * (i + 1)]) / 2)) + 1
-
-        trailing_rest_samps = midpoint_idx - move_regions[2 * (i + 1) - 1]
-        if trailing_rest_samps <= rest_length_cap * fs:
-            rep[last_end_idx:midpoint_idx] = cur_rep
-            last_end_idx = midpoint_idx
-            rep_regions[2 * i + 1] = midpoint_idx - 1
-        else:
-            rep_end_idx = (move_regions[2 * (i + 1) - 1] +
-                           int(round(rest_length_cap * fs)))
-            rep[last_end_idx:rep_end_idx] = cur_rep
-            last_end_idx = ((move_regions[2 * (i + 1)] -
-                             int(round(rest_length_cap * fs))))
-            rep_regions[2 * i + 1] = rep_end_idx - 1
-            nb_capped += 2
-
-        cur_rep += 1
-        if cur_rep > nb_unique_reps:
-            cur_rep = 1
-
-    end_idx = int(round((rep.shape[0] + move_regions[-1]) / 2))
-    rep[last_end_idx:end_idx] = cur_rep
-    rep_regions[-2] = last_end_idx
-    rep_regions[-1] = end_idx - 1
+    rep, rep_regions, nb_capped, _ = _refine_reps(rep.shape[0], move_regions, nb_unique_reps, fs, rest_length_cap)
 
     return {'rep': rep,
             'move': move,
@@ -486,27 +382,30 @@ def import_db2_unrefined(folder_path, subject, rest_length_cap=999):
             }
 
 
-def import_db2_acc(folder_path, subject):
+def import_db2_acc(folder_path, subject, dtype=None):
     """Function for extracting acceleronmeter data from raw NinaiPro files for DB2.
 
     Args:
         folder_path (string): Path to folder containing raw mat files
         subject (int): 1-40 which subject's data to import
+        dtype (TYPE, optional): What precision to store accelerometer data in - if None use the pipeline precision
 
     Returns:
         array: Raw accceleronmeter from each electrode
     """
+    dtype = _resolve_dtype(dtype)
+
     cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E1_A1.mat')
     data = sio.loadmat(cur_path)
-    acc = np.squeeze(np.array(data['acc']))
+    acc = np.squeeze(np.array(data['acc'], dtype=dtype))
 
     cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E2_A1.mat')
     data = sio.loadmat(cur_path)
-    acc = np.vstack((acc, np.array(data['acc'])))
+    acc = np.vstack((acc, np.array(data['acc'], dtype=dtype)))
 
     cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E3_A1.mat')
     data = sio.loadmat(cur_path)
-    acc = np.vstack((acc, np.array(data['acc'])))
+    acc = np.vstack((acc, np.array(data['acc'], dtype=dtype)))
 
     return acc
 
@@ -611,7 +510,7 @@ def gen_split_rand(rep_ids, nb_test, nb_splits, base=None):
     return train_reps, test_reps
 
 
-def normalise_emg(emg, reps, train_reps, movements=None, which_moves=None):
+def normalise_emg(emg, reps, train_reps, movements=None, which_moves=None, dtype=None, cache_key=None):
     """Preprocess train+test data to mean 0, std 1 based on training data only.
 
     Args:
@@ -620,91 +519,909 @@ def normalise_emg(emg, reps, train_reps, movements=None, which_moves=None):
         train_reps (array): Which repetitions are in the training set
         movements (array, optional): Movement labels, required if using which_moves
         which_moves (array, optional): Which movements to return - if None use all
+        dtype (TYPE, optional): What precision to return EMG data in - if None use the pipeline precision, otherwise
+            keep the precision of emg
+        cache_key (hashable, optional): Identifies the subject (e.g. (db, subject)) - if given per repetition and
+            movement moments are cached so later calls with any training set skip rescanning the data
 
     Returns:
-        array: Rescaled EMG data
+        array: Rescaled EMG data (emg is rescaled in place when the precision is unchanged and cache_key is None,
+            with a cache_key a new array is always returned and emg is left untouched)
+
+    Raises:
+        ValueError: If no observation belongs to the training set
+
+    Note:
+        Statistics are accumulated in float64 whatever the storage precision. The cached moments describe the raw
+        emg, so always pass the same raw array with a given cache_key
     """
+    if cache_key is not None:
+        moments = _cached_group_moments(cache_key, emg, reps, movements)
+        if which_moves is None or movements is None:
+            which_moves = None
+        count, mean, m2 = merge_group_moments(moments, train_reps, which_moves)
+        if count == 0:
+            raise ValueError('no observations found for the training repetitions/movements')
+
+        # Never rescale in place here: the cached moments must keep matching emg for later calls
+        return _apply_scaling(emg, mean, _moments_to_scale(count, m2), dtype, in_place=False)
+
     train_targets = get_idxs(reps, train_reps)
 
     # Keep only selected movement(s)
     if which_moves is not None and movements is not None:
         move_targets = get_idxs(movements[train_targets], which_moves)
         train_targets = train_targets[move_targets]
+    if train_targets.size == 0:
+        raise ValueError('no observations found for the training repetitions/movements')
 
-    scaler = StandardScaler(with_mean=True,
-                            with_std=True,
-                            copy=False).fit(emg[train_targets, :])
+    count, mean, m2 = _channel_moments(emg, train_targets)
 
-    return scaler.transform(emg)
+    return _apply_scaling(emg, mean, _moments_to_scale(count, m2), dtype)
 
 
-def get_windows(which_reps, window_len, window_inc, emg, movements, repetitons, which_moves=None, dtype=np.float32):
-    """Get set of windows based on repetition and movement criteria and associated label + repetition data.
+def get_group_moments(emg, reps, movements=None):
+    """Per-channel moments of every repetition (and movement) in a single pass over the data.
 
     Args:
-        which_reps (array): Which repetitions to return
-        window_len (int): Desired window length
-        window_inc (int): Desired window increment
-        emg (array): EMG data (should be normalise beforehand)
-        movements (array): Movement labels
-        repetitons (array): Repetition labels
-        which_moves (array, optional): Which movements to return - if None use all
-        dtype (TYPE, optional): What precision to use for EMG data
+        emg (array): Raw EMG data
+        reps (array): Corresponding repetition information for each EMG observation
+        movements (array, optional): Movement labels - if None group by repetition only
 
     Returns:
-        X_data (array): Windowed EMG data
-        Y_data (array): Movement label for each window
-        R_data (array): Repetition label for each window
+        Dictionary: (repetition, movement) -> (count, mean, sum of squared deviations), movement is None when
+            movements are not given
     """
-    nb_obs = emg.shape[0]
-    nb_channels = emg.shape[1]
+    change = np.diff(reps) != 0
+    if movements is not None:
+        change |= np.diff(movements) != 0
+    run_starts = np.concatenate(([0], np.where(change)[0] + 1))
+    run_ends = np.append(run_starts[1:], reps.shape[0])
 
-    # All possible window end locations given an increment size
-    possible_targets = np.array(range(window_len - 1, nb_obs, window_inc))
+    moments = {}
+    for start, end in zip(run_starts, run_ends):
+        key = (int(reps[start]), None if movements is None else int(movements[start]))
+        run_moments = _channel_moments(emg[start:end])
+        if key in moments:
+            run_moments = _merge_moments(*(moments[key] + run_moments))
+        moments[key] = run_moments
 
-    targets = get_idxs(repetitons[possible_targets], which_reps)
+    return moments
 
-    # Re-adjust back to original range (for indexinging into rep/move)
-    targets = (window_len - 1) + targets * window_inc
 
-    # Keep only selected movement(s)
+def merge_group_moments(moments, which_reps, which_moves=None):
+    """Combine group moments into the per-channel moments of a set of repetitions (and movements).
+
+    Args:
+        moments (Dictionary): Group moments from get_group_moments
+        which_reps (array): Which repetitions to include
+        which_moves (array, optional): Which movements to include - if None use all
+
+    Returns:
+        count (int): Number of observations
+        mean (array): Per-channel mean
+        m2 (array): Per-channel sum of squared deviations from the mean
+    """
+    which_reps = set(int(x) for x in which_reps)
     if which_moves is not None:
-        move_targets = get_idxs(movements[targets], which_moves)
-        targets = targets[move_targets]
+        which_moves = set(int(x) for x in which_moves)
 
-    X_data = np.zeros([targets.shape[0], window_len, nb_channels, 1],
-                      dtype=dtype)
-    Y_data = np.zeros([targets.shape[0], ], dtype=np.int8)
-    R_data = np.zeros([targets.shape[0], ], dtype=np.int8)
-    for i, win_end in enumerate(targets):
-        win_start = win_end - (window_len - 1)
-        X_data[i, :, :, 0] = emg[win_start:win_end + 1, :]  # Include end
-        Y_data[i] = movements[win_end]
-        R_data[i] = repetitons[win_end]
+    nb_channels = next(iter(moments.values()))[1].shape[0]
+    merged = (0, np.zeros((nb_channels,)), np.zeros((nb_channels,)))
+    for (cur_rep, cur_move) in sorted(moments, key=lambda x: (x[0], -1 if x[1] is None else x[1])):
+        if cur_rep in which_reps and (which_moves is None or cur_move in which_moves):
+            merged = _merge_moments(*(merged + moments[(cur_rep, cur_move)]))
 
-    return X_data, Y_data, R_data
+    return merged
 
 
-def to_categorical(y, nb_classes=None):
-    """Convert a class vector (integers) to binary class matrix.
+def clear_moment_cache():
+    """Forget all group moments cached by normalise_emg."""
+    _moment_cache.clear()
 
-    E.g. for use with categorical_crossentropy.
-    # Arguments
-        y: class vector to be converted into a matrix
-            (integers from 0 to nb_classes).
-        nb_classes: total number of classes.
-    # Returns
-        A binary matrix representation of the input.
 
-    Taken from:
-    https://github.com/fchollet/keras/blob/master/keras/utils/np_utils.py
-    v2.0.2 of Keras to remove unnecessary Keras dependency
-    """
-    y = np.array(y, dtype='int').ravel()
+def _cached_group_moments(cache_key, emg, reps, movements):
+    """Group moments for a subject, computed on first use then kept in a bounded LRU cache."""
+    key = (cache_key, movements is not None)
+    if key in _moment_cache:
+        shape, moments = _moment_cache.pop(key)
+        if shape == emg.shape:
+            _moment_cache[key] = (shape, moments)
+            return moments
+
+    moments = get_group_moments(emg, reps, movements)
+    _moment_cache[key] = (emg.shape, moments)
+    while len(_moment_cache) > _MOMENT_CACHE_SIZE:
+        _moment_cache.popitem(last=False)
+
+    return moments
+
+
+def _channel_moments(emg, idxs=None):
+    """Per-channel count, mean and sum of squared deviations accumulated in float64 over chunks of observations."""
+    if idxs is None:
+        idxs = slice(None)
+        nb_obs = emg.shape[0]
+    else:
+        nb_obs = idxs.shape[0]
+
+    count = 0
+    mean = np.zeros((emg.shape[1],), dtype=np.float64)
+    m2 = np.zeros((emg.shape[1],), dtype=np.float64)
+    for start in range(0, nb_obs, _CHUNK_SIZE):
+        if isinstance(idxs, slice):
+            chunk = emg[start:start + _CHUNK_SIZE]
+        else:
+            chunk = emg[idxs[start:start + _CHUNK_SIZE]]
+        count, mean, m2 = _merge_moments(count, mean, m2, *_chunk_moments(chunk))
+
+    return count, mean, m2
+
+
+def _chunk_moments(chunk):
+    """Count, mean and sum of squared deviations of a single chunk."""
+    chunk_mean = np.mean(chunk, axis=0, dtype=np.float64)
+    chunk_m2 = np.sum(np.square(chunk - chunk_mean, dtype=np.float64), axis=0)
+    return chunk.shape[0], chunk_mean, chunk_m2
+
+
+def _merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """Combine two sets of moments (Chan et al. parallel variance)."""
+    count = count_a + count_b
+    if count == 0:
+        return count, mean_a, m2_a
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (count_b / count)
+    m2 = m2_a + m2_b + np.square(delta) * (count_a * count_b / count)
+    return count, mean, m2
+
+
+def _moments_to_scale(count, m2):
+    """Standard deviation from moments, zero variance channels are left unscaled (as StandardScaler)."""
+    scale = np.sqrt(m2 / max(count, 1))
+    scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+    return scale
+
+
+def _apply_scaling(emg, mean, scale, dtype=None, in_place=True):
+    """Standardise emg chunk by chunk, in place when allowed and the precision is unchanged."""
+    dtype = _resolve_dtype(dtype, emg.dtype)
+    if in_place and dtype == emg.dtype:
+        out = emg
+    else:
+        out = np.empty(emg.shape, dtype=dtype)
+
+    for start in range(0, emg.shape[0], _CHUNK_SIZE):
+        chunk = emg[start:start + _CHUNK_SIZE].astype(np.float64)
+        chunk -= mean
+        chunk /= scale
+        out[start:start + _CHUNK_SIZE] = chunk
+
+    return out
+
+
+def get_segments(rep, move, exercise_starts=None, rep_regions=None, capped=None):
+    """Build the segment table: one row per run of constant repetition and movement.
+
+    Args:
+        rep (array): Repetition labels
+        move (array): Movement labels
+        exercise_starts (array, optional): Index where each exercise starts - if None everything is exercise 1
+        rep_regions (array, optional): Repetition boundaries as returned by the importers
+        capped (array, optional): Which entries of rep_regions were set by the rest length cap
+
+    Returns:
+        array: Structured array of SEGMENT_DTYPE (start, end, rep, move, capped, exercise)
+    """
+    if exercise_starts is None:
+        exercise_starts = np.array([0])
+
+    change = (np.diff(rep) != 0) | (np.diff(move) != 0)
+    starts = np.union1d(np.concatenate(([0], np.where(change)[0] + 1)), exercise_starts)
+    ends = np.append(starts[1:], rep.shape[0]) - 1
+
+    segments = np.zeros((starts.shape[0],), dtype=SEGMENT_DTYPE)
+    segments['start'] = starts
+    segments['end'] = ends
+    segments['rep'] = rep[starts]
+    segments['move'] = move[starts]
+    segments['exercise'] = np.searchsorted(exercise_starts, starts, side='right')
+
+    # Rest segments whose start/end was set by the rest length cap
+    if rep_regions is not None and capped is not None:
+        capped_starts = rep_regions[0::2][capped[0::2]]
+        capped_ends = rep_regions[1::2][capped[1::2]]
+        segments['capped'] = ((segments['move'] == 0) &
+                              (_is_in_sorted(starts, capped_starts) | _is_in_sorted(ends, capped_ends)))
+
+    return segments
+
+
+def _is_in_sorted(values, sorted_array):
+    """Whether each value appears in a sorted array."""
+    if sorted_array.shape[0] == 0:
+        return np.zeros(values.shape, dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_array, values), sorted_array.shape[0] - 1)
+    return sorted_array[pos] == values
+
+
+def select_segments(segments, which_reps=None, which_moves=None):
+    """Keep the segments of the given repetitions and movements, ordered as get_windows orders windows.
+
+    Args:
+        segments (array): Segment table from the importers or get_segments
+        which_reps (array, optional): Which repetitions to keep - if None keep all
+        which_moves (array, optional): Which movements to keep - if None keep all
+
+    Returns:
+        array: Selected segments grouped by movement (in which_moves order), then repetition (in which_reps order),
+            then time
+    """
+    keys = [segments['start']]
+    keep = np.ones((segments.shape[0],), dtype=bool)
+    for field, which in (('rep', which_reps), ('move', which_moves)):
+        if which is not None:
+            which = np.asarray(which)
+            is_in = segments[field][:, None] == which[None, :]
+            keep &= np.any(is_in, axis=1)
+            keys.append(np.argmax(is_in, axis=1))
+
+    order = np.lexsort(keys)
+
+    return segments[order[keep[order]]]
+
+
+def segment_lookup(segments, idxs):
+    """Find which segment each observation index falls in by binary search.
+
+    Args:
+        segments (array): Segment table covering every observation
+        idxs (array): Observation indices
+
+    Returns:
+        array: Row of segments for each index (use segments[result]['move'] etc. for labels)
+    """
+    return np.searchsorted(segments['start'], idxs, side='right') - 1
+
+
+def get_segment_targets(segments, window_len, window_inc, which_reps=None, which_moves=None):
+    """Get window end indices segment by segment, equivalent to get_window_targets but without scanning labels.
+
+    Args:
+        segments (array): Segment table from the importers or get_segments
+        window_len (int): Desired window length
+        window_inc (int): Desired window increment
+        which_reps (array, optional): Which repetitions to return - if None use all
+        which_moves (array, optional): Which movements to return - if None use all
+
+    Returns:
+        array: Index of the last observation of each window (ordered as get_windows returns them)
+    """
+    return _grid_targets(select_segments(segments, which_reps, which_moves), window_len, window_inc)
+
+
+def _grid_targets(selected, window_len, window_inc):
+    """Window end indices falling inside each of the selected segments, in segment order."""
+    # Window ends lie on the grid window_len - 1 + k * window_inc
+    first = np.maximum(selected['start'] - (window_len - 1), 0)
+    first_k = (first + window_inc - 1) // window_inc
+    last_k = (selected['end'] - (window_len - 1)) // window_inc
+    nb_targets = np.maximum(last_k - first_k + 1, 0)
+
+    offsets = np.arange(np.sum(nb_targets)) - np.repeat(np.cumsum(nb_targets) - nb_targets, nb_targets)
+    return (window_len - 1) + (np.repeat(first_k, nb_targets) + offsets) * window_inc
+
+
+def get_windows(which_reps, window_len, window_inc, emg, movements, repetitons, which_moves=None, dtype=None,
+                layout='NTC1', copy=True, label='end', min_purity=1.0, segments=None):
+    """Get set of windows based on repetition and movement criteria and associated label + repetition data.
+
+    Args:
+        which_reps (array): Which repetitions to return
+        window_len (int): Desired window length
+        window_inc (int): Desired window increment
+        emg (array): EMG data (should be normalise beforehand)
+        movements (array): Movement labels
+        repetitons (array): Repetition labels
+        which_moves (array, optional): Which movements to return - if None use all
+        dtype (TYPE, optional): What precision to use for EMG data - if None use the pipeline precision (or float32)
+        layout (str, optional): Memory layout of X_data: 'NTC1' [window, time_step, channel, 1] for Keras, 'NTC'
+            [window, time_step, channel], 'NCT' [window, channel, time_step] for PyTorch or 'flat'
+            [window, time_step * channel]
+        copy (bool, optional): If False windows are returned in time order and as a read-only view into emg when
+            they are evenly spaced and dtype matches emg (otherwise a copy is still made). The 'flat' layout also
+            needs a C-contiguous emg, so it is always copied for importer output (Fortran ordered, use
+            np.ascontiguousarray first to get a view)
+        label (str, optional): How to label windows: 'end' by the movement of the last observation, 'majority' by
+            the most common movement or 'pure' as majority but dropping windows that straddle movements
+        min_purity (float, optional): Fraction of a window that must carry its label for it to be kept when
+            label is 'pure'
+        segments (array, optional): Segment table matching the labels (from the importers) - if given windows are
+            selected segment by segment (and labelled from its rows) instead of scanning the labels, movements are
+            also selected segment by segment when label is 'end'
+
+    Returns:
+        X_data (array): Windowed EMG data
+        Y_data (array): Movement label for each window
+        R_data (array): Repetition label for each window
+    """
+    targets, move_labels = _select_targets(which_reps, window_len, window_inc, movements, repetitons, which_moves,
+                                           label, min_purity, segments)
+
+    return _windows_from_targets(targets, window_len, emg, movements, repetitons, dtype, layout, copy, move_labels)
+
+
+def get_window_targets(which_reps, window_len, window_inc, movements, repetitons, which_moves=None, label='end',
+                       min_purity=1.0, segments=None):
+    """Get the end index of every window matching the repetition and movement criteria without copying any EMG.
+
+    Args:
+        which_reps (array): Which repetitions to return
+        window_len (int): Desired window length
+        window_inc (int): Desired window increment
+        movements (array): Movement labels
+        repetitons (array): Repetition labels
+        which_moves (array, optional): Which movements to return - if None use all
+        label (str, optional): How windows are labelled when selecting movements, see get_windows
+        min_purity (float, optional): Purity threshold when label is 'pure', see get_windows
+        segments (array, optional): Segment table matching the labels, see get_windows
+
+    Returns:
+        array: Index of the last observation of each window (ordered as get_windows returns them)
+    """
+    return _select_targets(which_reps, window_len, window_inc, movements, repetitons, which_moves, label,
+                           min_purity, segments)[0]
+
+
+def _select_targets(which_reps, window_len, window_inc, movements, repetitons, which_moves, label, min_purity,
+                    segments=None):
+    """Window end indices matching the criteria along with the movement label of each window."""
+    if label not in _LABELS:
+        raise ValueError('label should be one of ' + ', '.join(_LABELS))
+
+    if segments is not None:
+        # Movements can only be selected from the segments when windows are labelled by their last observation
+        targets = get_segment_targets(segments, window_len, window_inc, which_reps,
+                                      which_moves if label == 'end' else None)
+        if label == 'end':
+            return targets, movements[targets]
+    else:
+        nb_obs = repetitons.shape[0]
+
+        # All possible window end locations given an increment size
+        possible_targets = np.array(range(window_len - 1, nb_obs, window_inc))
+
+        targets = get_idxs(repetitons[possible_targets], which_reps)
+
+        # Re-adjust back to original range (for indexinging into rep/move)
+        targets = (window_len - 1) + targets * window_inc
+
+    if label == 'end':
+        move_labels = movements[targets]
+    else:
+        move_labels, purity = get_window_labels(targets, window_len, movements, 'majority', segments)
+        if label == 'pure':
+            is_pure = purity >= min_purity
+            targets = targets[is_pure]
+            move_labels = move_labels[is_pure]
+
+    # Keep only selected movement(s)
+    if which_moves is not None:
+        move_targets = get_idxs(move_labels, which_moves)
+        targets = targets[move_targets]
+        move_labels = move_labels[move_targets]
+
+    return targets, move_labels
+
+
+def get_window_labels(targets, window_len, movements, label='majority', segments=None):
+    """Label every window at once from the runs of constant movement it covers.
+
+    Args:
+        targets (array): Window end indices, e.g. from get_window_targets
+        window_len (int): Window length
+        movements (array): Movement labels
+        label (str, optional): 'end' for the movement of the last observation or 'majority' for the most common
+            movement (ties go to the movement at the end of the window)
+        segments (array, optional): Segment table matching movements - if given its rows are used as the runs
+            instead of scanning movements
+
+    Returns:
+        move_labels (array): Movement label for each window
+        purity (array): Fraction of each window's observations carrying its label
+    """
+    targets = np.asarray(targets)
+    nb_windows = targets.shape[0]
+    end_labels = movements[targets]
+    if nb_windows == 0:
+        return end_labels, np.zeros((0,))
+
+    # Run-length encode movements then list every (window, run) overlap: windows rarely cover more than two runs
+    if segments is None:
+        run_starts = np.concatenate(([0], np.where(np.diff(movements))[0] + 1))
+        run_ends = np.append(run_starts[1:], movements.shape[0]) - 1
+    else:
+        run_starts, run_ends = segments['start'], segments['end']
+    win_starts = targets - (window_len - 1)
+    first_run = np.searchsorted(run_starts, win_starts, side='right') - 1
+    nb_runs = np.searchsorted(run_starts, targets, side='right') - first_run
+
+    win = np.repeat(np.arange(nb_windows), nb_runs)
+    run_offset = np.arange(win.shape[0]) - np.repeat(np.cumsum(nb_runs) - nb_runs, nb_runs)
+    run = first_run[win] + run_offset
+    cover = (np.minimum(run_ends[run], targets[win]) -
+             np.maximum(run_starts[run], win_starts[win]) + 1)
+    run_labels = movements[run_starts[run]]
+
+    # Total coverage per (window, movement)
+    order = np.lexsort((run_labels, win))
+    win, run_labels, cover = win[order], run_labels[order], cover[order]
+    new_group = np.ones(win.shape[0], dtype=bool)
+    new_group[1:] = (win[1:] != win[:-1]) | (run_labels[1:] != run_labels[:-1])
+    group_starts = np.where(new_group)[0]
+    group_cover = np.add.reduceat(cover, group_starts)
+    group_win = win[group_starts]
+    group_labels = run_labels[group_starts]
+    is_end = group_labels == end_labels[group_win]
+
+    if label == 'end':
+        return end_labels, group_cover[is_end] / float(window_len)
+    elif label != 'majority':
+        raise ValueError('label should be either end or majority')
+
+    # Highest coverage per window, half a sample extra breaks ties towards the end label
+    score = group_cover + 0.5 * is_end
+    order = np.lexsort((score, group_win))
+    is_last = np.ones(order.shape[0], dtype=bool)
+    is_last[:-1] = group_win[order][1:] != group_win[order][:-1]
+    best = order[is_last]
+
+    return group_labels[best], group_cover[best] / float(window_len)
+
+
+def sample_window_targets(targets, movements, nb_per_move='min', rest_ratio=None, seed=None):
+    """Draw a class-balanced subset of window end indices.
+
+    Args:
+        targets (array): Window end indices, e.g. from get_window_targets
+        movements (array): Movement labels
+        nb_per_move (int or str, optional): Maximum number of windows to keep per movement, 'min' to use the size of
+            the smallest movement class (fully balanced) or None for no cap
+        rest_ratio (float, optional): Cap on rest (move 0) windows as a multiple of the mean number of windows kept
+            per movement - if None rest is capped like any other movement
+        seed (int, optional): Seed for the random draw
+
+    Returns:
+        array: Subset of targets, in their original order
+    """
+    return targets[_balanced_mask(movements[targets], nb_per_move, rest_ratio, seed)]
+
+
+def _balanced_mask(labels, nb_per_move, rest_ratio, seed):
+    """Boolean mask drawing a class-balanced subset of windows with the given labels."""
+    if labels.shape[0] == 0:
+        return np.zeros(0, dtype=bool)
+
+    rng = np.random.RandomState(seed)
+    classes, counts = np.unique(labels, return_counts=True)
+
+    is_move = classes != 0
+    if nb_per_move == 'min':
+        nb_per_move = np.min(counts[is_move]) if np.any(is_move) else np.min(counts)
+    if nb_per_move is None:
+        nb_keep = counts.copy()
+    else:
+        nb_keep = np.minimum(counts, int(nb_per_move))
+
+    if rest_ratio is not None and np.any(is_move) and not np.all(is_move):
+        rest_cap = int(round(rest_ratio * np.mean(nb_keep[is_move])))
+        nb_keep[~is_move] = min(counts[~is_move][0], rest_cap)
+
+    keep = np.zeros(labels.shape[0], dtype=bool)
+    for cur_move, nb_cur in zip(classes, nb_keep):
+        cur_idxs = np.where(labels == cur_move)[0]
+        if nb_cur < cur_idxs.shape[0]:
+            cur_idxs = rng.choice(cur_idxs, nb_cur, replace=False)
+        keep[cur_idxs] = True
+
+    return keep
+
+
+def get_windows_balanced(which_reps, window_len, window_inc, emg, movements, repetitons, which_moves=None,
+                         nb_per_move='min', rest_ratio=None, seed=None, dtype=None, layout='NTC1', copy=True,
+                         label='end', min_purity=1.0, segments=None):
+    """Get a class-balanced set of windows, sampling before any EMG is copied.
+
+    Args:
+        which_reps (array): Which repetitions to return
+        window_len (int): Desired window length
+        window_inc (int): Desired window increment
+        emg (array): EMG data (should be normalise beforehand)
+        movements (array): Movement labels
+        repetitons (array): Repetition labels
+        which_moves (array, optional): Which movements to return - if None use all
+        nb_per_move (int or str, optional): See sample_window_targets
+        rest_ratio (float, optional): See sample_window_targets
+        seed (int, optional): Seed for the random draw
+        dtype (TYPE, optional): What precision to use for EMG data - if None use the pipeline precision (or float32)
+        layout (str, optional): Memory layout of X_data: 'NTC1' [window, time_step, channel, 1] for Keras, 'NTC'
+            [window, time_step, channel], 'NCT' [window, channel, time_step] for PyTorch or 'flat'
+            [window, time_step * channel]
+        copy (bool, optional): If False windows are returned in time order and as a read-only view into emg when
+            they are evenly spaced and dtype matches emg (otherwise a copy is still made). The 'flat' layout also
+            needs a C-contiguous emg, so it is always copied for importer output (Fortran ordered, use
+            np.ascontiguousarray first to get a view)
+        label (str, optional): How to label windows: 'end' by the movement of the last observation, 'majority' by
+            the most common movement or 'pure' as majority but dropping windows that straddle movements
+        min_purity (float, optional): Fraction of a window that must carry its label for it to be kept when
+            label is 'pure'
+        segments (array, optional): Segment table matching the labels (from the importers), see get_windows
+
+    Returns:
+        X_data (array): Windowed EMG data
+        Y_data (array): Movement label for each window
+        R_data (array): Repetition label for each window
+    """
+    targets, move_labels = _select_targets(which_reps, window_len, window_inc, movements, repetitons, which_moves,
+                                           label, min_purity, segments)
+    keep = _balanced_mask(move_labels, nb_per_move, rest_ratio, seed)
+
+    return _windows_from_targets(targets[keep], window_len, emg, movements, repetitons, dtype, layout, copy,
+                                 move_labels[keep])
+
+
+def get_windows_multi(which_reps, configs, emg, movements, repetitons, which_moves=None, dtype=None, layout='NTC1',
+                      label='end', min_purity=1.0, segments=None, features=None):
+    """Get windows for several (window_len, window_inc) configurations from a single shared buffer.
+
+    Repetition/movement selection is done once and the EMG is converted to dtype once, every configuration then only
+    costs a strided view of the buffer and a small index array.
+
+    Args:
+        which_reps (array): Which repetitions to return
+        configs (list): (window_len, window_inc) pairs
+        emg (array): EMG data (should be normalise beforehand)
+        movements (array): Movement labels
+        repetitons (array): Repetition labels
+        which_moves (array, optional): Which movements to return - if None use all
+        dtype (TYPE, optional): What precision to use for EMG data - if None use the pipeline precision (or float32)
+        layout (str, optional): Memory layout of the windows, see get_windows ('flat' needs a C-contiguous buffer so
+            may copy emg once)
+        label (str, optional): How to label windows, see get_windows
+        min_purity (float, optional): Purity threshold when label is 'pure', see get_windows
+        segments (array, optional): Segment table matching the labels - if None it is built once from the labels
+        features (function, optional): Called as features(buffer, targets, window_len) to return feature arrays
+            instead of window views (e.g. lambda x, t, n: spectral_features(x, t, n, fs))
+
+    Returns:
+        list: For each configuration a dictionary with 'windows' (read-only view of every window on the
+            configuration's grid) and 'idxs' (which of those windows are selected, so X_data = windows[idxs]), or
+            'features' when features is given, along with 'Y' and 'R' labels of the selected windows
+    """
+    if label not in _LABELS:
+        raise ValueError('label should be one of ' + ', '.join(_LABELS))
+    if layout not in _LAYOUTS:
+        raise ValueError('layout should be one of ' + ', '.join(_LAYOUTS))
+
+    # Shared selection and buffer
+    if segments is None:
+        segments = get_segments(repetitons, movements)
+    selected = select_segments(segments, which_reps, which_moves if label == 'end' else None)
+    dtype = _resolve_dtype(dtype, np.float32)
+    buffer = emg if emg.dtype == dtype else emg.astype(dtype)
+    if layout == 'flat' and features is None:
+        buffer = np.ascontiguousarray(buffer)
+
+    results = []
+    for window_len, window_inc in configs:
+        targets = _grid_targets(selected, window_len, window_inc)
+        if label == 'end':
+            move_labels = movements[targets]
+        else:
+            move_labels, purity = get_window_labels(targets, window_len, movements, 'majority', segments)
+            if label == 'pure':
+                targets, move_labels = targets[purity >= min_purity], move_labels[purity >= min_purity]
+            if which_moves is not None:
+                move_targets = get_idxs(move_labels, which_moves)
+                targets, move_labels = targets[move_targets], move_labels[move_targets]
+
+        result = {'Y': move_labels.astype(np.int8), 'R': repetitons[targets].astype(np.int8)}
+        if features is None:
+            result['windows'] = _window_view(buffer, window_len, window_inc, layout)
+            result['idxs'] = (targets - (window_len - 1)) // window_inc
+        else:
+            result['features'] = features(buffer, targets, window_len)
+        results.append(result)
+
+    return results
+
+
+def _windows_from_targets(targets, window_len, emg, movements, repetitons, dtype, layout='NTC1', copy=True,
+                          move_labels=None):
+    """Get the windows ending at each target index, built directly in the requested layout."""
+    if layout not in _LAYOUTS:
+        raise ValueError('layout should be one of ' + ', '.join(_LAYOUTS))
+    dtype = _resolve_dtype(dtype, np.float32)
+    nb_windows = targets.shape[0]
+    if move_labels is None:
+        move_labels = movements[targets]
+    if not copy:
+        order = np.argsort(targets, kind='mergesort')
+        targets = targets[order]
+        move_labels = move_labels[order]
+
+    Y_data = move_labels.astype(np.int8)
+    R_data = repetitons[targets].astype(np.int8)
+
+    # Evenly spaced windows of matching precision can be served straight from emg
+    if not copy and nb_windows > 0 and dtype == emg.dtype:
+        steps = np.diff(targets)
+        step = int(steps[0]) if nb_windows > 1 else 1
+        if step > 0 and np.all(steps == step) and (layout != 'flat' or emg.flags.c_contiguous):
+            win_start = targets[0] - (window_len - 1)
+            return _window_view(emg[win_start:], window_len, step, layout)[:nb_windows], Y_data, R_data
+
+    # Flat windows are filled as [window, time_step, channel] then reshaped, which avoids needing a contiguous emg
+    fill_layout = 'NTC' if layout == 'flat' else layout
+    all_windows = _window_view(emg, window_len, 1, fill_layout)
+    win_starts = targets - (window_len - 1)
+    X_data = np.empty((nb_windows,) + all_windows.shape[1:], dtype=dtype)
+    chunk_len = max(1, _CHUNK_SIZE // window_len)
+    for start in range(0, nb_windows, chunk_len):
+        X_data[start:start + chunk_len] = all_windows[win_starts[start:start + chunk_len]]
+
+    if layout == 'flat':
+        X_data = X_data.reshape(nb_windows, -1)
+
+    return X_data, Y_data, R_data
+
+
+def _as_ntc(X_data, layout):
+    """View windowed data in any non-flat layout as [window, time_step, channel]."""
+    if layout == 'NTC1':
+        return X_data[..., 0]
+    elif layout == 'NCT':
+        return X_data.transpose(0, 2, 1)
+    return X_data
+
+
+def _window_view(emg, window_len, step, layout):
+    """Read-only strided view of every step-th window of emg (first one starting at 0) in the given layout.
+
+    The flat layout needs emg to be C-contiguous.
+    """
+    obs_stride, ch_stride = emg.strides
+    nb_channels = emg.shape[1]
+    nb_windows = max(0, (emg.shape[0] - window_len) // step + 1)
+
+    if layout == 'NTC1':
+        shape = (nb_windows, window_len, nb_channels, 1)
+        strides = (step * obs_stride, obs_stride, ch_stride, ch_stride)
+    elif layout == 'NTC':
+        shape = (nb_windows, window_len, nb_channels)
+        strides = (step * obs_stride, obs_stride, ch_stride)
+    elif layout == 'NCT':
+        shape = (nb_windows, nb_channels, window_len)
+        strides = (step * obs_stride, ch_stride, obs_stride)
+    else:
+        shape = (nb_windows, window_len * nb_channels)
+        strides = (step * obs_stride, ch_stride)
+
+    windows = as_strided(emg, shape=shape, strides=strides)
+    windows.flags.writeable = False  # Windows overlap so writes would leak between them
+    return windows
+
+
+def get_spectral_features(which_reps, window_len, window_inc, emg, movements, repetitons, fs, which_moves=None,
+                          bands=None, taper='hann', dtype=None, label='end', min_purity=1.0, segments=None):
+    """Get frequency-domain features of every window, aligned with the Y/R outputs of get_windows.
+
+    Args:
+        which_reps (array): Which repetitions to return
+        window_len (int): Desired window length
+        window_inc (int): Desired window increment
+        emg (array): EMG data (should be normalise beforehand)
+        movements (array): Movement labels
+        repetitons (array): Repetition labels
+        fs (int): Sample frequency (see db_info)
+        which_moves (array, optional): Which movements to return - if None use all
+        bands (array, optional): [low, high) frequency limits of each band power - if None split up to Nyquist into
+            4 equal bands
+        taper (str, optional): Window applied before the FFT (any scipy.signal.get_window name) or None
+        dtype (TYPE, optional): What precision to return features in - if None use the pipeline precision (or
+            float32), never below float32 as raw spectral moments overflow float16
+        label (str, optional): How to label windows, see get_windows
+        min_purity (float, optional): Purity threshold when label is 'pure', see get_windows
+        segments (array, optional): Segment table matching the labels, see get_windows
+
+    Returns:
+        F_data (array): Features [window, channel, feature] with features ordered as mean frequency, median frequency,
+            spectral moments 0-2 then each band power
+        Y_data (array): Movement label for each window
+        R_data (array): Repetition label for each window
+    """
+    targets, move_labels = _select_targets(which_reps, window_len, window_inc, movements, repetitons, which_moves,
+                                           label, min_purity, segments)
+    F_data = spectral_features(emg, targets, window_len, fs, bands, taper, dtype)
+
+    return F_data, move_labels.astype(np.int8), repetitons[targets].astype(np.int8)
+
+
+def spectral_features(emg, targets, window_len, fs, bands=None, taper='hann', dtype=None):
+    """Frequency-domain features of the windows ending at each target, using a batched real FFT in bounded chunks.
+
+    Args:
+        emg (array): EMG data
+        targets (array): Window end indices, e.g. from get_window_targets
+        window_len (int): Window length
+        fs (int): Sample frequency
+        bands (array, optional): [low, high) frequency limits of each band power - if None split up to Nyquist into
+            4 equal bands
+        taper (str, optional): Window applied before the FFT (any scipy.signal.get_window name) or None
+        dtype (TYPE, optional): What precision to return features in - if None use the pipeline precision (or
+            float32), never below float32 as raw spectral moments overflow float16
+
+    Returns:
+        array: Features [window, channel, feature], see get_spectral_features for the order
+    """
+    dtype = np.promote_types(_resolve_dtype(dtype, np.float32), np.float32)
+    freqs = np.fft.rfftfreq(window_len, 1.0 / fs)
+    if bands is None:
+        edges = np.linspace(0, fs / 2.0, 5)
+        bands = list(zip(edges[:-1], edges[1:]))
+        bands[-1] = (bands[-1][0], np.inf)  # Keep the Nyquist bin
+    band_masks = [(freqs >= low) & (freqs < high) for low, high in bands]
+
+    if taper is not None:
+        if (taper, window_len) not in _taper_cache:
+            _taper_cache[(taper, window_len)] = get_window(taper, window_len)[:, None]
+        taper = _taper_cache[(taper, window_len)]
+
+    nb_windows = targets.shape[0]
+    all_windows = _window_view(emg, window_len, 1, 'NTC')
+    win_starts = targets - (window_len - 1)
+    F_data = np.empty((nb_windows, emg.shape[1], 5 + len(band_masks)), dtype=dtype)
+
+    chunk_len = max(1, _CHUNK_SIZE // window_len)
+    for start in range(0, nb_windows, chunk_len):
+        windows = all_windows[win_starts[start:start + chunk_len]]
+        if taper is not None:
+            windows = windows * taper
+        power = np.square(np.abs(np.fft.rfft(windows, axis=1)))  # [window, frequency, channel]
+
+        moment_0 = np.sum(power, axis=1)
+        moment_1 = np.tensordot(freqs, power, axes=(0, 1))
+        moment_2 = np.tensordot(np.square(freqs), power, axes=(0, 1))
+        has_power = moment_0 > 0
+        total = np.where(has_power, moment_0, 1.0)
+
+        cum_power = np.cumsum(power, axis=1)
+        median_idx = np.argmax(cum_power >= cum_power[:, -1:, :] / 2.0, axis=1)
+
+        chunk = F_data[start:start + chunk_len]
+        chunk[:, :, 0] = np.where(has_power, moment_1 / total, 0)
+        chunk[:, :, 1] = freqs[median_idx]
+        chunk[:, :, 2] = moment_0
+        chunk[:, :, 3] = moment_1
+        chunk[:, :, 4] = moment_2
+        for i, band_mask in enumerate(band_masks):
+            chunk[:, :, 5 + i] = np.sum(power[:, band_mask, :], axis=1)
+
+    return F_data
+
+
+def augment_windows(X_data, noise_std=0.0, gain_std=0.0, max_shift=0, max_warp=0.0, layout='NTC1', seed=None,
+                    out=None):
+    """Augment a whole batch of windows at once: time warping, electrode shift, gain jitter and additive noise.
+
+    Args:
+        X_data (array): Windowed EMG data as returned by get_windows
+        noise_std (float, optional): Standard deviation of additive Gaussian noise
+        gain_std (float, optional): Standard deviation of the per window, per channel gain (centred on 1)
+        max_shift (int, optional): Maximum number of positions channels are rotated by (electrode shift)
+        max_warp (float, optional): Maximum relative stretch/compression of each window around its centre
+        layout (str, optional): Layout of X_data ('NTC1', 'NTC' or 'NCT')
+        seed (int or RandomState, optional): Seed or random state (pass a RandomState to continue a sequence)
+        out (array, optional): Buffer to write into, at least as long as X_data - if None X_data is augmented in place
+            (read-only windows such as the views from get_windows(..., copy=False) then fail with 'output array is
+            read-only', pass a buffer instead)
+
+    Returns:
+        array: Augmented windows (a view of out when given)
+    """
+    if layout not in ('NTC1', 'NTC', 'NCT'):
+        raise ValueError('layout should be one of NTC1, NTC, NCT')
+    rng = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+
+    nb_windows = X_data.shape[0]
+    if out is None:
+        out = X_data
+    else:
+        out = out[:nb_windows]
+        if out is not X_data:
+            out[...] = X_data
+
+    # Work on a [window, time_step, channel] view whatever the layout
+    windows = _as_ntc(out, layout)
+    _, window_len, nb_channels = windows.shape
+
+    if max_warp > 0 or max_shift > 0:
+        win_idx = np.arange(nb_windows)[:, None, None]
+
+        # Source time step (fractional) for each output step
+        centre = (window_len - 1) / 2.0
+        stretch = rng.uniform(1 - max_warp, 1 + max_warp, size=(nb_windows, 1))
+        time_src = np.clip(centre + (np.arange(window_len) - centre) * stretch, 0, window_len - 1)
+        time_lo = np.floor(time_src).astype(int)
+        time_hi = np.minimum(time_lo + 1, window_len - 1)
+        frac = (time_src - time_lo)[:, :, None]
+
+        # Source channel for each output channel
+        shift = rng.randint(-max_shift, max_shift + 1, size=(nb_windows, 1))
+        chan_src = ((np.arange(nb_channels) - shift) % nb_channels)[:, None, :]
+
+        lo = windows[win_idx, time_lo[:, :, None], chan_src]
+        hi = windows[win_idx, time_hi[:, :, None], chan_src]
+        windows[...] = lo + frac * (hi - lo)
+
+    if gain_std > 0:
+        windows *= rng.normal(1.0, gain_std, size=(nb_windows, 1, nb_channels)).astype(out.dtype)
+
+    if noise_std > 0:
+        windows += rng.normal(0.0, noise_std, size=windows.shape).astype(out.dtype)
+
+    return out
+
+
+def augment_batches(X_data, Y_data, batch_size, shuffle=True, seed=None, layout='NTC1', **augment_args):
+    """Iterate over augmented batches of windows, reusing one buffer for every batch.
+
+    Args:
+        X_data (array): Windowed EMG data as returned by get_windows
+        Y_data (array): Movement label for each window
+        batch_size (int): Number of windows per batch
+        shuffle (bool, optional): Whether to shuffle the windows
+        seed (int, optional): Seed for shuffling and augmentation
+        layout (str, optional): Layout of X_data ('NTC1', 'NTC' or 'NCT')
+        **augment_args: Passed on to augment_windows (noise_std, gain_std, max_shift, max_warp)
+
+    Yields:
+        X_batch (array): Augmented windows (overwritten by the next batch, copy if you need to keep it)
+        Y_batch (array): Movement label for each window
+    """
+    rng = np.random.RandomState(seed)
+    nb_windows = X_data.shape[0]
+    order = rng.permutation(nb_windows) if shuffle else np.arange(nb_windows)
+    buffer = np.empty((min(batch_size, nb_windows),) + X_data.shape[1:], dtype=X_data.dtype)
+
+    for start in range(0, nb_windows, batch_size):
+        batch_idxs = order[start:start + batch_size]
+        X_batch = buffer[:batch_idxs.shape[0]]
+        np.take(X_data, batch_idxs, axis=0, out=X_batch)
+        yield augment_windows(X_batch, layout=layout, seed=rng, **augment_args), Y_data[batch_idxs]
+
+
+def to_categorical(y, nb_classes=None, dtype=None):
+    """Convert a class vector (integers) to binary class matrix.
+
+    E.g. for use with categorical_crossentropy.
+    # Arguments
+        y: class vector to be converted into a matrix
+            (integers from 0 to nb_classes).
+        nb_classes: total number of classes.
+        dtype: precision of the output, if None use the pipeline precision (or float64).
+    # Returns
+        A binary matrix representation of the input.
+
+    Taken from:
+    https://github.com/fchollet/keras/blob/master/keras/utils/np_utils.py
+    v2.0.2 of Keras to remove unnecessary Keras dependency
+    """
+    y = np.array(y, dtype='int').ravel()
     if not nb_classes:
         nb_classes = np.max(y) + 1
     n = y.shape[0]
-    categorical = np.zeros((n, nb_classes))
+    categorical = np.zeros((n, nb_classes), dtype=_resolve_dtype(dtype, np.float64))
     categorical[np.arange(n), y] = 1
     return categorical
 
@@ -825,7 +1542,7 @@ def db_info(db):
             }
 
 
-def import_subject(folder_path, subject, db, rest_length_cap=999):
+def import_subject(folder_path, subject, db, rest_length_cap=999, dtype=None):
     """Function for extracting data from raw NinaiPro files for DB1.
 
     Args:
@@ -833,96 +1550,79 @@ def import_subject(folder_path, subject, db, rest_length_cap=999):
         subject (int): 1-27 which subject's data to import
         rest_length_cap (int, optional): The number of seconds of rest data to keep before/after a movement
         db (int): Which database to get info on (1 or 2 currently)
+        dtype (TYPE, optional): What precision to store EMG data in - if None use the pipeline precision
 
     Returns:
         Dictionary: Raw EMG data, corresponding repetition and movement labels, indices of where repetitions are
-            demarked and the number of repetitions with capped off rest data
+            demarked, the number of repetitions with capped off rest data and the segment table (see get_segments)
     """
+    return relabel_subject(import_subject_raw(folder_path, subject, db, dtype), rest_length_cap)
+
+
+def import_subject_raw(folder_path, subject, db, dtype=None):
+    """Load a subject's EMG, original repetition and remapped movement labels once, ready for relabel_subject.
+
+    Args:
+        folder_path (string): Path to folder containing raw mat files
+        subject (int): Which subject's data to import (1-27 for DB1, 1-40 for DB2)
+        db (int): Which database to get info on (1 or 2 currently)
+        dtype (TYPE, optional): What precision to store EMG data in - if None use the pipeline precision
+
+    Returns:
+        Dictionary: Raw EMG data, original repetition and remapped movement labels, where movements change, the
+            number of labelled repetitions, where each exercise starts and the sample frequency
+    """
+    dtype = _resolve_dtype(dtype)
+    exercise_starts = [0]
+
     if db == 1:
         fs = 100
 
         cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_A1_E1.mat')
         data = sio.loadmat(cur_path)
-        emg = np.squeeze(np.array(data['emg']))
+        emg = np.squeeze(np.array(data['emg'], dtype=dtype))
         rep = np.squeeze(np.array(data['rerepetition']))
         move = np.squeeze(np.array(data['restimulus']))
 
+        exercise_starts.append(rep.shape[0])
         cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_A1_E2.mat')
         data = sio.loadmat(cur_path)
-        emg = np.vstack((emg, np.array(data['emg'])))
+        emg = np.vstack((emg, np.array(data['emg'], dtype=dtype)))
         rep = np.append(rep, np.squeeze(np.array(data['rerepetition'])))
         move_tmp = np.squeeze(np.array(data['restimulus']))  # Fix for numbering
         move_tmp[move_tmp != 0] += max(move)
         move = np.append(move, move_tmp)
 
+        exercise_starts.append(rep.shape[0])
         cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_A1_E3.mat')
         data = sio.loadmat(cur_path)
-        emg = np.vstack((emg, np.array(data['emg'])))
+        emg = np.vstack((emg, np.array(data['emg'], dtype=dtype)))
         rep = np.append(rep, np.squeeze(np.array(data['rerepetition'])))
         move_tmp = np.squeeze(np.array(data['restimulus']))  # Fix for numbering
         move_tmp[move_tmp != 0] += max(move)
         move = np.append(move, move_tmp)
 
-        move = move.astype('int8')  # To minimise overhead
-
-        # Label repetitions using new block style: rest-move-rest regions
-        move_regions = np.where(np.diff(move))[0]
-        rep_regions = np.zeros((move_regions.shape[0],), dtype=int)
-        nb_reps = int(round(move_regions.shape[0] / 2))
-        last_end_idx = int(round(move_regions[0] / 2))
-        nb_unique_reps = np.unique(rep).shape[0] - 1  # To account for 0 regions
-        nb_capped = 0
-        cur_rep = 1
-
-        rep = np.zeros([rep.shape[0], ], dtype=np.int8)  # Reset rep array
-        for i in range(nb_reps - 1):
-            rep_regions[2 * i] = last_end_idx
-            midpoint_idx = int(round((move_regions[2 * (i + 1) - 1] +
-                                      move_regions[2 * (i + 1)]) / 2)) + 1
-
-            trailing_rest_samps = midpoint_idx - move_regions[2 * (i + 1) - 1]
-            if trailing_rest_samps <= rest_length_cap * fs:
-                rep[last_end_idx:midpoint_idx] = cur_rep
-                last_end_idx = midpoint_idx
-                rep_regions[2 * i + 1] = midpoint_idx - 1
-
-            else:
-                rep_end_idx = (move_regions[2 * (i + 1) - 1] +
-                               int(round(rest_length_cap * fs)))
-                rep[last_end_idx:rep_end_idx] = cur_rep
-                last_end_idx = ((move_regions[2 * (i + 1)] -
-                                 int(round(rest_length_cap * fs))))
-                rep_regions[2 * i + 1] = rep_end_idx - 1
-                nb_capped += 2
-
-            cur_rep += 1
-            if cur_rep > nb_unique_reps:
-                cur_rep = 1
-
-        end_idx = int(round((emg.shape[0] + move_regions[-1]) / 2))
-        rep[last_end_idx:end_idx] = cur_rep
-        rep_regions[-2] = last_end_idx
-        rep_regions[-1] = end_idx - 1
-
     elif db == 2:
         fs = 2000
 
         cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E1_A1.mat')
         data = sio.loadmat(cur_path)
-        emg = np.squeeze(np.array(data['emg']))
+        emg = np.squeeze(np.array(data['emg'], dtype=dtype))
         rep = np.squeeze(np.array(data['rerepetition']))
         move = np.squeeze(np.array(data['restimulus']))
 
+        exercise_starts.append(rep.shape[0])
         cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E2_A1.mat')
         data = sio.loadmat(cur_path)
-        emg = np.vstack((emg, np.array(data['emg'])))
+        emg = np.vstack((emg, np.array(data['emg'], dtype=dtype)))
         rep = np.append(rep, np.squeeze(np.array(data['rerepetition'])))
         move_tmp = np.squeeze(np.array(data['restimulus']))
         move = np.append(move, move_tmp)  # Note no fix needed for this exercise
 
+        exercise_starts.append(rep.shape[0])
         cur_path = os.path.normpath(folder_path + '/S' + str(subject) + '_E3_A1.mat')
         data = sio.loadmat(cur_path)
-        emg = np.vstack((emg, np.array(data['emg'])))
+        emg = np.vstack((emg, np.array(data['emg'], dtype=dtype)))
         data['repetition'][-1] = 0  # Fix for diffing
         rep = np.append(rep, np.squeeze(np.array(data['repetition'])))
 
@@ -941,51 +1641,551 @@ def import_subject(folder_path, subject, db, rest_length_cap=999):
         move_tmp = np.squeeze(np.array(data['stimulus']))
         move = np.append(move, move_tmp)
 
-        move = move.astype('int8')  # To minimise overhead
-
-        # Label repetitions using new block style: rest-move-rest regions
-        move_regions = np.where(np.diff(move))[0]
-        rep_regions = np.zeros((move_regions.shape[0],), dtype=int)
-        nb_reps = int(round(move_regions.shape[0] / 2))
-        last_end_idx = int(round(move_regions[0] / 2))
-        nb_unique_reps = np.unique(rep).shape[0] - 1  # To account for 0 regions
-        nb_capped = 0
-        cur_rep = 1
-
-        rep = np.zeros([rep.shape[0], ], dtype=np.int8)  # Reset rep array
-        for i in range(nb_reps - 1):
-            rep_regions[2 * i] = last_end_idx
-            midpoint_idx = int(round((move_regions[2 * (i + 1) - 1] +
-                                      move_regions[2 * (i + 1)]) / 2)) + 1
-
-            trailing_rest_samps = midpoint_idx - move_regions[2 * (i + 1) - 1]
-            if trailing_rest_samps <= rest_length_cap * fs:
-                rep[last_end_idx:midpoint_idx] = cur_rep
-                last_end_idx = midpoint_idx
-                rep_regions[2 * i + 1] = midpoint_idx - 1
-            else:
-                rep_end_idx = (move_regions[2 * (i + 1) - 1] +
-                               int(round(rest_length_cap * fs)))
-                rep[last_end_idx:rep_end_idx] = cur_rep
-                last_end_idx = ((move_regions[2 * (i + 1)] -
-                                 int(round(rest_length_cap * fs))))
-                rep_regions[2 * i + 1] = rep_end_idx - 1
-                nb_capped += 2
-
-            cur_rep += 1
-            if cur_rep > nb_unique_reps:
-                cur_rep = 1
-
-        end_idx = int(round((emg.shape[0] + move_regions[-1]) / 2))
-        rep[last_end_idx:end_idx] = cur_rep
-        rep_regions[-2] = last_end_idx
-        rep_regions[-1] = end_idx - 1
     else:
         raise ValueError('db should be either 1 for database 1 or 2 for database 2')
 
+    move = move.astype('int8')  # To minimise overhead
+
     return {'emg': emg,
             'rep': rep,
             'move': move,
+            'move_regions': np.where(np.diff(move))[0],
+            'nb_unique_reps': np.unique(rep).shape[0] - 1,  # To account for 0 regions
+            'exercise_starts': np.array(exercise_starts),
+            'fs': fs
+            }
+
+
+def relabel_subject(raw, rest_length_cap=999):
+    """Label repetitions of raw subject data as rest-move-rest blocks, capping the rest kept around each movement.
+
+    Cheap enough to be reapplied for every rest_length_cap of interest without reloading.
+
+    Args:
+        raw (Dictionary): Subject data from import_subject_raw
+        rest_length_cap (int, optional): The number of seconds of rest data to keep before/after a movement
+
+    Returns:
+        Dictionary: Raw EMG data, corresponding repetition and movement labels, indices of where repetitions are
+            demarked, the number of repetitions with capped off rest data and the segment table (see get_segments),
+            EMG and movements are shared with raw
+    """
+    rep, rep_regions, nb_capped, capped = _refine_reps(raw['move'].shape[0], raw['move_regions'],
+                                                       raw['nb_unique_reps'], raw['fs'], rest_length_cap)
+
+    return {'emg': raw['emg'],
+            'rep': rep,
+            'move': raw['move'],
             'rep_regions': rep_regions,
-            'nb_capped': nb_capped
+            'nb_capped': nb_capped,
+            'segments': get_segments(rep, raw['move'], raw['exercise_starts'], rep_regions, capped)
+            }
+
+
+def relabel_subject_caps(raw, rest_length_caps):
+    """Relabel raw subject data for several rest length caps at once.
+
+    Args:
+        raw (Dictionary): Subject data from import_subject_raw
+        rest_length_caps (array): Rest length caps (seconds) to relabel for
+
+    Returns:
+        Dictionary: Result of relabel_subject for each rest length cap
+    """
+    return {rest_length_cap: relabel_subject(raw, rest_length_cap) for rest_length_cap in rest_length_caps}
+
+
+def _refine_reps(nb_obs, move_regions, nb_unique_reps, fs, rest_length_cap):
+    """Split observations into rest-move-rest repetition blocks, capping rest at rest_length_cap seconds.
+
+    Also flags which entries of rep_regions were set by the cap.
+    """
+    rep = np.zeros([nb_obs, ], dtype=np.int8)
+    rep_regions = np.zeros((move_regions.shape[0],), dtype=int)
+    capped = np.zeros((move_regions.shape[0],), dtype=bool)
+
+    nb_capped = _kernel(_refine_reps_loop)(rep, rep_regions, capped, move_regions.astype(np.int64), nb_unique_reps,
+                                           float(rest_length_cap * fs), int(round(rest_length_cap * fs)))
+
+    return rep, rep_regions, nb_capped, capped
+
+
+def _refine_reps_loop(rep, rep_regions, capped, move_regions, nb_unique_reps, cap_samps, cap_idxs):
+    """Fill rep, rep_regions and capped in place, returning the number of capped rest regions (numba kernel)."""
+    nb_obs = rep.shape[0]
+    nb_reps = int(round(move_regions.shape[0] / 2))
+    last_end_idx = int(round(move_regions[0] / 2))
+    nb_capped = 0
+    cur_rep = 1
+
+    for i in range(nb_reps - 1):
+        rep_regions[2 * i] = last_end_idx
+        midpoint_idx = int(round((move_regions[2 * (i + 1) - 1] +
+                                  move_regions[2 * (i + 1)]) / 2)) + 1
+
+        trailing_rest_samps = midpoint_idx - move_regions[2 * (i + 1) - 1]
+        if trailing_rest_samps <= cap_samps:
+            rep[last_end_idx:midpoint_idx] = cur_rep
+            last_end_idx = midpoint_idx
+            rep_regions[2 * i + 1] = midpoint_idx - 1
+        else:
+            rep_end_idx = move_regions[2 * (i + 1) - 1] + cap_idxs
+            rep[last_end_idx:rep_end_idx] = cur_rep
+            last_end_idx = move_regions[2 * (i + 1)] - cap_idxs
+            rep_regions[2 * i + 1] = rep_end_idx - 1
+            capped[2 * i + 1] = True
+            capped[2 * (i + 1)] = True
+            nb_capped += 2
+
+        cur_rep += 1
+        if cur_rep > nb_unique_reps:
+            cur_rep = 1
+
+    end_idx = int(round((nb_obs + move_regions[-1]) / 2))
+    rep[last_end_idx:end_idx] = cur_rep
+    rep_regions[-2] = last_end_idx
+    rep_regions[-1] = end_idx - 1
+
+    return nb_capped
+
+
+def loso_folds(folder_path, db, subjects=None, rest_length_cap=999, which_reps=None, which_moves=None,
+               nb_workers=None, dtype=None, keep_data=False):
+    """Leave-one-subject-out folds normalised on the other subjects, from one pass of per-subject statistics.
+
+    Each subject's moments are computed once (in parallel), each fold's training statistics are merged from them
+    and fold data is only loaded when used. Unless keep_data is set loading re-imports the mat files, so a full
+    sweep over S subjects costs S * S imports on top of the S used for the statistics (each fold loads its test
+    subject and iter_train its S - 1 training subjects).
+
+    Args:
+        folder_path (string): Path to folder containing raw mat files
+        db (int): Which database the subjects are from (1 or 2 currently)
+        subjects (array, optional): Which subjects to include - if None use all
+        rest_length_cap (int, optional): The number of seconds of rest data to keep before/after a movement
+        which_reps (array, optional): Which repetitions statistics are computed over - if None use all labelled ones
+        which_moves (array, optional): Which movements statistics are computed over - if None use all
+        nb_workers (int, optional): Number of processes computing subject statistics - if None use all CPUs
+        dtype (TYPE, optional): What precision to store EMG data in - if None use the pipeline precision
+        keep_data (bool, optional): Keep every subject's imported data in memory so each subject is only imported
+            once (folds then normalise a copy) - needs enough memory for all subjects
+
+    Yields:
+        Dictionary: Test subject, training subjects, training mean and scale, the normalised test subject data and a
+            function iterating over (subject, normalised data) for the training subjects
+
+    Raises:
+        ValueError: If fewer than 2 subjects are given or a fold has no training observations
+    """
+    if subjects is None:
+        subjects = np.array(range(1, db_info(db)['nb_subjects'] + 1))
+    if len(subjects) < 2:
+        raise ValueError('leave-one-subject-out folds need at least 2 subjects')
+    if which_reps is None:
+        which_reps = db_info(db)['rep_labels']
+    dtype = _resolve_dtype(dtype)
+
+    jobs = [(folder_path, subject, db, rest_length_cap, dtype, keep_data) for subject in subjects]
+    if nb_workers == 1:
+        results = [_subject_moments(job) for job in jobs]
+    else:
+        pool = Pool(nb_workers)
+        try:
+            results = pool.map(_subject_moments, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    subject_moments = [merge_group_moments(moments, which_reps, which_moves) for moments, _ in results]
+    subject_data = {subject: data for subject, (_, data) in zip(subjects, results)}
+
+    def load_normalised(subject, mean, scale):
+        if keep_data:
+            data = dict(subject_data[subject])
+            data['emg'] = _apply_scaling(data['emg'], mean, scale, in_place=False)
+        else:
+            data = import_subject(folder_path, subject, db, rest_length_cap, dtype)
+            data['emg'] = _apply_scaling(data['emg'], mean, scale)
+        return data
+
+    for test_idx, test_subject in enumerate(subjects):
+        train_subjects = [subject for i, subject in enumerate(subjects) if i != test_idx]
+        merged = (0, 0.0, 0.0)
+        for i, moments in enumerate(subject_moments):
+            if i != test_idx:
+                merged = _merge_moments(*(merged + moments))
+        count, mean, m2 = merged
+        if count == 0:
+            raise ValueError('no training observations found for which_reps/which_moves in fold of subject ' +
+                             str(test_subject))
+        scale = _moments_to_scale(count, m2)
+
+        def iter_train(train_subjects=train_subjects, mean=mean, scale=scale):
+            for subject in train_subjects:
+                yield subject, load_normalised(subject, mean, scale)
+
+        yield {'test_subject': test_subject,
+               'train_subjects': train_subjects,
+               'mean': mean,
+               'scale': scale,
+               'test': load_normalised(test_subject, mean, scale),
+               'iter_train': iter_train,
+               }
+
+
+def _subject_moments(job):
+    """Group moments of a single subject, and its data when kept (run in a worker process by loso_folds)."""
+    folder_path, subject, db, rest_length_cap, dtype, keep_data = job
+    data = import_subject(folder_path, subject, db, rest_length_cap, dtype)
+    return get_group_moments(data['emg'], data['rep'], data['move']), data if keep_data else None
+
+
+def benchmark_backends(nb_obs=1800000, nb_channels=12, nb_repeats=20, seed=0):
+    """Time the hot loops under each available backend on synthetic data (defaults are roughly one DB2 subject).
+
+    Only the kernels themselves are timed (e.g. the repetition relabelling loop without building the segment table).
+
+    Args:
+        nb_obs (int, optional): Number of synthetic observations
+        nb_channels (int, optional): Number of synthetic channels
+        nb_repeats (int, optional): Number of timed runs per benchmark (the best is kept)
+        seed (int, optional): Seed for the synthetic data
+
+    Returns:
+        Dictionary: For each benchmark ('refine_reps') the best time in seconds under each backend and, when numba is
+            installed, the 'speedup' of numba over numpy
+    """
+    raw = _synthetic_subject(nb_obs, nb_channels, 2000, 6, seed)
+
+    benchmarks = {'refine_reps': lambda: _refine_reps(raw['move'].shape[0], raw['move_regions'],
+                                                      raw['nb_unique_reps'], raw['fs'], 1)}
+
+    backends = ['numpy'] if numba is None else ['numpy', 'numba']
+    prev_backend = _backend['name']
+    timings = {}
+    try:
+        for name in backends:
+            set_backend(name)
+            for bench, func in benchmarks.items():
+                func()  # Warm up (compiles kernels)
+                timings.setdefault(bench, {})[name] = min(timeit.repeat(func, number=1, repeat=nb_repeats))
+    finally:
+        set_backend(prev_backend)
+
+    for bench_timings in timings.values():
+        if 'numba' in bench_timings:
+            bench_timings['speedup'] = bench_timings['numpy'] / bench_timings['numba']
+
+    return timings
+
+
+def _synthetic_subject(nb_obs, nb_channels, fs, nb_reps, seed=0):
+    """Raw subject data (as import_subject_raw) of repeated rest-move-rest blocks with random EMG."""
+    rng = np.random.RandomState(seed)
+    move_len = 5 * fs
+    rest_len = 3 * fs
+    nb_blocks = max(1, (nb_obs - rest_len) // (move_len + rest_len))
+
+    move = np.zeros((nb_obs,), dtype=np.int8)
+    rep = np.zeros((nb_obs,), dtype=np.int8)
+    for block in range(nb_blocks):
+        start = rest_len + block * (move_len + rest_len)
+        move[start:start + move_len] = 1 + (block // nb_reps) % 49
+        rep[start:start + move_len] = 1 + block % nb_reps
+
+    return {'emg': rng.standard_normal((nb_obs, nb_channels)),
+            'rep': rep,
+            'move': move,
+            'move_regions': np.where(np.diff(move))[0],
+            'nb_unique_reps': nb_reps,
+            'exercise_starts': np.array([0]),
+            'fs': fs
+            }
+
+
+def precompute_grid(folder_path, out_path, db, subjects=None, window_lens=(15,), window_incs=(1,),
+                    rest_length_caps=(999,), train_reps=None, dtype=None, layout='NTC1', nb_workers=None):
+    """Write windowed datasets for every (subject, window_len, window_inc, rest_length_cap) cell of a grid.
+
+    Each subject is loaded once, relabelled and normalised once per rest length cap, then the windowing cells are
+    generated in a process pool reading the normalised data from memory-mapped files (so workers never hold a copy
+    of it). Windows are written in chunks to memory-mappable .npy files under
+    out_path/S<subject>/cap<cap>_len<window_len>_inc<window_inc>/ (X.npy, Y.npy, R.npy) along with the settings
+    they were made with (params.json). Cells already finished with the same settings are skipped so an interrupted
+    run can simply be restarted, cells made with other settings (train_reps, dtype, layout) are regenerated.
+
+    Args:
+        folder_path (string): Path to folder containing raw mat files
+        out_path (string): Folder to write the datasets to
+        db (int): Which database the subjects are from (1 or 2 currently)
+        subjects (array, optional): Which subjects to process - if None use all
+        window_lens (array, optional): Window lengths
+        window_incs (array, optional): Window increments
+        rest_length_caps (array, optional): Rest length caps (seconds)
+        train_reps (array, optional): Repetitions used for normalisation statistics - if None use all
+        dtype (TYPE, optional): What precision to store EMG data in - if None use the pipeline precision (or float32)
+        layout (str, optional): Memory layout of X, see get_windows
+        nb_workers (int, optional): Number of processes generating cells - if None use all CPUs
+
+    Returns:
+        list: Paths of the cells written by this call
+    """
+    if subjects is None:
+        subjects = np.array(range(1, db_info(db)['nb_subjects'] + 1))
+    which_reps = db_info(db)['rep_labels']
+    if train_reps is None:
+        train_reps = which_reps
+    out_dtype = _resolve_dtype(dtype, np.float32)
+
+    written = []
+    for subject in subjects:
+        subject_path = os.path.join(out_path, 'S' + str(subject))
+        cells = []
+        for cap in rest_length_caps:
+            for window_len in window_lens:
+                for window_inc in window_incs:
+                    cell_path = os.path.join(subject_path, 'cap%g_len%d_inc%d' % (cap, window_len, window_inc))
+                    params = {'db': int(db), 'subject': int(subject), 'rest_length_cap': float(cap),
+                              'window_len': int(window_len), 'window_inc': int(window_inc),
+                              'train_reps': [int(x) for x in train_reps], 'dtype': np.dtype(out_dtype).name,
+                              'layout': layout}
+                    if _cell_params(cell_path) != params:
+                        cells.append((cell_path, params))
+        if not cells:
+            continue
+        if not os.path.isdir(subject_path):
+            os.makedirs(subject_path)
+
+        # Normalised data of each cap goes to disk so workers can memory-map it
+        raw = import_subject_raw(folder_path, subject, db)
+        data_paths = {}
+        try:
+            for cap in sorted(set(params['rest_length_cap'] for _, params in cells)):
+                data = relabel_subject(raw, cap)
+                emg = raw['emg'].copy() if out_dtype == raw['emg'].dtype else raw['emg']  # Rescaled in place otherwise
+                emg = normalise_emg(emg, data['rep'], train_reps, dtype=out_dtype)
+                data_paths[cap] = os.path.join(subject_path, '.data_cap%g' % cap)
+                _save_arrays(data_paths[cap], emg=emg, move=data['move'], rep=data['rep'],
+                             segments=data['segments'])
+                del data, emg
+            del raw
+
+            jobs = [(cell_path, params, data_paths[params['rest_length_cap']], which_reps)
+                    for cell_path, params in cells]
+            if nb_workers == 1:
+                written.extend(_precompute_cell(job) for job in jobs)
+            else:
+                pool = Pool(nb_workers)
+                try:
+                    written.extend(pool.map(_precompute_cell, jobs))
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            for data_path in data_paths.values():
+                shutil.rmtree(data_path, ignore_errors=True)
+
+    return written
+
+
+def precompute_main(argv=None):
+    """Console entry point (nina-precompute) for precompute_grid."""
+    parser = argparse.ArgumentParser(description='Precompute windowed NinaPro datasets over a parameter grid.')
+    parser.add_argument('folder_path', help='folder containing the raw mat files')
+    parser.add_argument('out_path', help='folder to write the datasets to')
+    parser.add_argument('--db', type=int, required=True, choices=[1, 2], help='database the subjects are from')
+    parser.add_argument('--subjects', type=int, nargs='+', help='subjects to process (default: all)')
+    parser.add_argument('--window-len', type=int, nargs='+', default=[15], help='window lengths (samples)')
+    parser.add_argument('--window-inc', type=int, nargs='+', default=[1], help='window increments (samples)')
+    parser.add_argument('--rest-length-cap', type=float, nargs='+', default=[999], help='rest caps (seconds)')
+    parser.add_argument('--train-reps', type=int, nargs='+', help='repetitions to normalise on (default: all)')
+    parser.add_argument('--dtype', default='float32', help='storage precision of the windows')
+    parser.add_argument('--layout', default='NTC1', choices=_LAYOUTS, help='memory layout of the windows')
+    parser.add_argument('--workers', type=int, help='number of processes (default: all CPUs)')
+    args = parser.parse_args(argv)
+
+    written = precompute_grid(args.folder_path, args.out_path, args.db, args.subjects, args.window_len,
+                              args.window_inc, args.rest_length_cap, args.train_reps, np.dtype(args.dtype),
+                              args.layout, args.workers)
+    print('Wrote %d cells to %s' % (len(written), args.out_path))
+
+
+def _cell_params(cell_path):
+    """Settings a finished precompute cell was made with (None if the cell does not exist)."""
+    params_path = os.path.join(cell_path, 'params.json')
+    if not os.path.isfile(params_path):
+        return None
+    with open(params_path) as params_file:
+        return json.load(params_file)
+
+
+def _save_arrays(folder_path, **arrays):
+    """Save each array to its own .npy file in folder_path (replacing any previous contents)."""
+    if os.path.isdir(folder_path):
+        shutil.rmtree(folder_path)
+    os.makedirs(folder_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(folder_path, name + '.npy'), array)
+
+
+def _precompute_cell(job):
+    """Window one grid cell, writing it chunk by chunk to a partial folder renamed once complete."""
+    cell_path, params, data_path, which_reps = job
+    emg, move, rep, segments = [np.load(os.path.join(data_path, name + '.npy'), mmap_mode='r')
+                                for name in ('emg', 'move', 'rep', 'segments')]
+    window_len, window_inc, layout = params['window_len'], params['window_inc'], params['layout']
+    targets = get_segment_targets(segments, window_len, window_inc, which_reps)
+
+    partial_path = cell_path + '.partial'
+    if os.path.isdir(partial_path):
+        shutil.rmtree(partial_path)  # Left over from an interrupted run
+    os.makedirs(partial_path)
+
+    X_empty = _windows_from_targets(targets[:0], window_len, emg, move, rep, emg.dtype, layout)[0]
+    X_data = np.lib.format.open_memmap(os.path.join(partial_path, 'X.npy'), mode='w+', dtype=emg.dtype,
+                                       shape=(targets.shape[0],) + X_empty.shape[1:])
+    chunk_len = max(1, _CHUNK_SIZE // window_len)
+    for start in range(0, targets.shape[0], chunk_len):
+        X_data[start:start + chunk_len] = _windows_from_targets(targets[start:start + chunk_len], window_len, emg,
+                                                                move, rep, emg.dtype, layout)[0]
+    X_data.flush()
+    del X_data
+
+    np.save(os.path.join(partial_path, 'Y.npy'), move[targets].astype(np.int8))
+    np.save(os.path.join(partial_path, 'R.npy'), rep[targets].astype(np.int8))
+    with open(os.path.join(partial_path, 'params.json'), 'w') as params_file:
+        json.dump(params, params_file, sort_keys=True)
+
+    # Replace a cell made with other settings only once the new one is complete
+    if os.path.isdir(cell_path):
+        shutil.rmtree(cell_path)
+    os.rename(partial_path, cell_path)
+
+    return cell_path
+
+
+def get_rep_dataset(data, which_reps=None, which_moves=None, dtype=None):
+    """Pack whole repetitions (rest-move-rest blocks) into one contiguous buffer for sequence models.
+
+    Args:
+        data (Dictionary): Subject data from import_subject (or relabel_subject), EMG should be normalised
+        which_reps (array, optional): Which repetitions to keep - if None keep all
+        which_moves (array, optional): Which movements to keep - if None keep all
+        dtype (TYPE, optional): What precision to use for EMG data - if None use the pipeline precision (or float32)
+
+    Returns:
+        Dictionary: Flat EMG buffer [observation, channel] holding every kept repetition back to back, with the
+            offset and length of each repetition in it and its repetition and movement labels
+    """
+    starts = data['rep_regions'][0::2]
+    ends = data['rep_regions'][1::2] + 1
+
+    # Each block holds a single movement surrounded by rest
+    bounds = np.stack((starts, ends), axis=1).ravel()
+    moves = np.maximum.reduceat(data['move'], bounds[:-1])[0::2]
+    reps = data['rep'][starts]
+
+    keep = np.ones(starts.shape, dtype=bool)
+    if which_reps is not None:
+        keep &= np.any(reps[:, None] == np.asarray(which_reps)[None, :], axis=1)
+    if which_moves is not None:
+        keep &= np.any(moves[:, None] == np.asarray(which_moves)[None, :], axis=1)
+    starts, ends, reps, moves = starts[keep], ends[keep], reps[keep], moves[keep]
+
+    lengths = ends - starts
+    offsets = (np.cumsum(lengths) - lengths).astype(np.int64)
+    emg = np.empty((np.sum(lengths), data['emg'].shape[1]), dtype=_resolve_dtype(dtype, np.float32))
+    for start, end, offset in zip(starts, ends, offsets):
+        emg[offset:offset + end - start] = data['emg'][start:end]
+
+    return {'emg': emg,
+            'offsets': offsets,
+            'lengths': lengths,
+            'rep': reps.astype(np.int8),
+            'move': moves.astype(np.int8)
             }
+
+
+def select_rep_dataset(dataset, which_reps=None, which_moves=None):
+    """Keep some repetitions of a repetition dataset without copying any EMG.
+
+    Args:
+        dataset (Dictionary): Repetition dataset from get_rep_dataset
+        which_reps (array, optional): Which repetitions to keep - if None keep all
+        which_moves (array, optional): Which movements to keep - if None keep all
+
+    Returns:
+        Dictionary: Repetition dataset sharing the EMG buffer of dataset
+    """
+    keep = np.ones(dataset['rep'].shape, dtype=bool)
+    if which_reps is not None:
+        keep &= np.any(dataset['rep'][:, None] == np.asarray(which_reps)[None, :], axis=1)
+    if which_moves is not None:
+        keep &= np.any(dataset['move'][:, None] == np.asarray(which_moves)[None, :], axis=1)
+
+    return {'emg': dataset['emg'],
+            'offsets': dataset['offsets'][keep],
+            'lengths': dataset['lengths'][keep],
+            'rep': dataset['rep'][keep],
+            'move': dataset['move'][keep]
+            }
+
+
+def rep_sequence(dataset, i):
+    """Return the EMG of the i-th repetition of a repetition dataset as a view [time_step, channel]."""
+    return dataset['emg'][dataset['offsets'][i]:dataset['offsets'][i] + dataset['lengths'][i]]
+
+
+def iter_rep_batches(dataset, batch_size, shuffle=True, seed=None, layout='NTC', pad_value=0):
+    """Iterate over padded batches of repetitions of similar length, reusing one buffer for every batch.
+
+    Repetitions are sorted by length and cut into batches so padding is minimal, the batch order is then shuffled.
+
+    Args:
+        dataset (Dictionary): Repetition dataset from get_rep_dataset
+        batch_size (int): Number of repetitions per batch
+        shuffle (bool, optional): Whether to shuffle the order of batches (and of equal length repetitions)
+        seed (int, optional): Seed for shuffling
+        layout (str, optional): 'NTC' [repetition, time_step, channel] or 'NCT' [repetition, channel, time_step]
+        pad_value (float, optional): Value used after the end of shorter repetitions
+
+    Yields:
+        X_batch (array): Padded EMG, as long as the longest repetition in the batch (overwritten by the next batch)
+        lengths (array): Length of each repetition
+        Y_batch (array): Movement label of each repetition
+        R_batch (array): Repetition label of each repetition
+    """
+    if layout not in ('NTC', 'NCT'):
+        raise ValueError('layout should be either NTC or NCT')
+    rng = np.random.RandomState(seed)
+    nb_seqs = dataset['lengths'].shape[0]
+    if nb_seqs == 0:
+        return
+
+    # Random tie-break keeps equal length repetitions from always landing in the same batch
+    tie_break = rng.permutation(nb_seqs) if shuffle else np.arange(nb_seqs)
+    order = np.lexsort((tie_break, dataset['lengths']))
+    batches = [order[start:start + batch_size] for start in range(0, nb_seqs, batch_size)]
+    if shuffle:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+
+    # Each batch is carved from the front of a flat buffer so it is C-contiguous whatever its length
+    nb_channels = dataset['emg'].shape[1]
+    max_len = int(np.max(dataset['lengths']))
+    buffer = np.empty((min(batch_size, nb_seqs) * max_len * nb_channels,), dtype=dataset['emg'].dtype)
+
+    for batch in batches:
+        lengths = dataset['lengths'][batch]
+        batch_len = int(np.max(lengths))
+        X_batch = buffer[:batch.shape[0] * batch_len * nb_channels]
+        if layout == 'NTC':
+            X_batch = X_batch.reshape(batch.shape[0], batch_len, nb_channels)
+        else:
+            X_batch = X_batch.reshape(batch.shape[0], nb_channels, batch_len)
+        X_batch.fill(pad_value)
+        for i, seq in enumerate(batch):
+            if layout == 'NTC':
+                X_batch[i, :lengths[i]] = rep_sequence(dataset, seq)
+            else:
+                X_batch[i, :, :lengths[i]] = rep_sequence(dataset, seq).T
+        yield X_batch, lengths, dataset['move'][batch], dataset['rep'][batch]
@@ -14,7 +14,12 @@ setup(name='nina_helper',
       # download_url='https://github.com/Lif3line/nina_helper_package_mk2/archive/2.2.tar.gz',  # Hack github address
       install_requires=[
           'scipy',
-          'sklearn',
           'numpy'
       ],
+      entry_points={
+          'console_scripts': ['nina-precompute = nina_helper.nina_helper:precompute_main']
+      },
+      extras_require={
+          'numba': ['numba']  # JIT-compiled kernels for the hot loops
+      },
       keywords='ninapro emg')
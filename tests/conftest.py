@@ -0,0 +1,59 @@
+"""Shared fixtures: synthetic subjects laid out like the NinaPro mat files."""
+
+import os
+
+import numpy as np
+import pytest
+import scipy.io as sio
+
+import nina_helper as nh
+
+
+def write_subject(folder_path, subject, db, scale=1.0, seed=0):
+    """Write mat files laid out like a NinaPro subject with random EMG.
+
+    Args:
+        folder_path (string): Folder to write the mat files to
+        subject (int): Subject number used in the file names
+        db (int): Which database to mimic (1 or 2 currently)
+        scale (float, optional): Fraction of the real movement (5s) and rest (3s) durations to use
+        seed (int, optional): Seed for the random EMG
+    """
+    info = nh.db_info(db)
+    fs = info['fs']
+    if db == 1:
+        suffixes = ['_A1_E1', '_A1_E2', '_A1_E3']
+        all_labels = [np.array(range(1, 13)), np.array(range(1, 18)), np.array(range(1, 24))]
+    else:
+        suffixes = ['_E1_A1', '_E2_A1', '_E3_A1']
+        all_labels = [np.array(range(1, 18)), np.array(range(18, 41)), np.array([1, 2, 4, 6, 8, 9, 16, 32, 40])]
+
+    rng = np.random.RandomState(seed)
+    move_len = max(1, int(round(5 * fs * scale)))
+    rest_len = max(1, int(round(3 * fs * scale)))
+    for exercise, (suffix, labels) in enumerate(zip(suffixes, all_labels)):
+        nb_blocks = labels.shape[0] * info['nb_reps']
+        nb_obs = rest_len + nb_blocks * (move_len + rest_len)
+
+        # Each block is a movement followed by rest, preceded by one rest period
+        block = (np.arange(nb_obs) - rest_len) // (move_len + rest_len)
+        is_move = (np.arange(nb_obs) >= rest_len) & ((np.arange(nb_obs) - rest_len) % (move_len + rest_len) < move_len)
+        stimulus = np.where(is_move, labels[np.clip(block, 0, nb_blocks - 1) // info['nb_reps']], 0)
+        repetition = np.where(is_move, 1 + np.clip(block, 0, nb_blocks - 1) % info['nb_reps'], 0)
+
+        contents = {'emg': rng.standard_normal((nb_obs, info['nb_channels'])),
+                    'stimulus': stimulus[:, None],
+                    'repetition': repetition[:, None]}
+        if not (db == 2 and exercise == 2):  # Last DB2 exercise has no refined labels
+            contents['restimulus'] = stimulus[:, None]
+            contents['rerepetition'] = repetition[:, None]
+        sio.savemat(os.path.join(folder_path, 'S' + str(subject) + suffix + '.mat'), contents)
+
+
+@pytest.fixture(scope='session')
+def db1_folder(tmp_path_factory):
+    """Three short DB1 subjects."""
+    folder_path = str(tmp_path_factory.mktemp('db1'))
+    for subject in (1, 2, 3):
+        write_subject(folder_path, subject, 1, scale=0.1, seed=subject)
+    return folder_path
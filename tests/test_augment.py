@@ -0,0 +1,58 @@
+"""Tests for window augmentation."""
+
+import numpy as np
+import pytest
+
+import nina_helper as nh
+
+
+@pytest.fixture
+def windows():
+    return np.random.RandomState(0).randn(32, 20, 10, 1).astype(np.float32)
+
+
+def test_shift_rotates_channels(windows):
+    out = nh.augment_windows(windows.copy(), max_shift=3, seed=0)
+    for x, y in zip(windows, out):
+        assert any(np.array_equal(np.roll(x, shift, axis=1), y) for shift in range(-3, 4))
+
+
+def test_layouts_agree(windows):
+    args = {'noise_std': 0.1, 'gain_std': 0.2, 'max_shift': 2, 'max_warp': 0.2, 'seed': 5}
+    ntc1 = nh.augment_windows(windows.copy(), layout='NTC1', **args)
+    nct = nh.augment_windows(np.ascontiguousarray(windows[..., 0].transpose(0, 2, 1)), layout='NCT', **args)
+    np.testing.assert_allclose(nct.transpose(0, 2, 1), ntc1[..., 0], rtol=1e-5, atol=1e-5)
+
+
+def test_out_leaves_input_untouched(windows):
+    original = windows.copy()
+    out = np.empty((40,) + windows.shape[1:], dtype=windows.dtype)
+    result = nh.augment_windows(windows, noise_std=0.1, max_shift=2, seed=0, out=out)
+    np.testing.assert_array_equal(windows, original)
+    assert np.shares_memory(result, out) and result.shape == windows.shape
+
+
+def test_read_only_views_need_out(windows):
+    view = windows.copy()
+    view.flags.writeable = False
+    with pytest.raises(ValueError, match='read-only'):
+        nh.augment_windows(view, noise_std=0.1, seed=0)
+    nh.augment_windows(view, noise_std=0.1, seed=0, out=np.empty_like(windows))
+
+
+def test_seed_reproducible(windows):
+    args = {'noise_std': 0.1, 'gain_std': 0.2, 'max_shift': 2, 'max_warp': 0.2, 'seed': 1}
+    np.testing.assert_array_equal(nh.augment_windows(windows.copy(), **args),
+                                  nh.augment_windows(windows.copy(), **args))
+
+
+def test_batches_reuse_buffer(windows):
+    labels = np.arange(windows.shape[0])
+    batches = list(nh.augment_batches(windows, labels, 10, seed=0))
+    assert [x.shape[0] for x, _ in batches] == [10, 10, 10, 2]
+    assert all(np.shares_memory(batches[0][0], x) for x, _ in batches[1:])
+
+    # Without augmentation each batch holds the windows of its labels (checked before the buffer is overwritten)
+    for x_batch, y_batch in nh.augment_batches(windows, labels, 10, seed=0):
+        np.testing.assert_array_equal(x_batch, windows[y_batch])
+    np.testing.assert_array_equal(np.sort(np.concatenate([y for _, y in batches])), labels)
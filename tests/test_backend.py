@@ -0,0 +1,24 @@
+"""Tests for the hot loop backends."""
+
+import numpy as np
+import pytest
+
+import nina_helper as nh
+
+
+def test_numpy_is_default():
+    assert nh.get_backend() == 'numpy'
+
+
+def test_numba_relabelling_matches_numpy(db1_folder):
+    pytest.importorskip('numba')
+    raw = nh.import_subject_raw(db1_folder, 1, 1)
+    expected = nh.relabel_subject(raw, 1)
+    nh.set_backend('numba')
+    try:
+        result = nh.relabel_subject(raw, 1)
+    finally:
+        nh.set_backend('numpy')
+
+    for key in ('rep', 'rep_regions', 'segments'):
+        np.testing.assert_array_equal(result[key], expected[key])
@@ -0,0 +1,35 @@
+"""Tests for loso_folds."""
+
+import numpy as np
+import pytest
+
+import nina_helper as nh
+
+
+def test_needs_two_subjects(db1_folder):
+    with pytest.raises(ValueError):
+        next(nh.loso_folds(db1_folder, 1, subjects=[1], nb_workers=1))
+
+
+def test_no_training_observations(db1_folder):
+    with pytest.raises(ValueError):
+        next(nh.loso_folds(db1_folder, 1, subjects=[1, 2], which_reps=[99], nb_workers=1))
+
+
+@pytest.mark.parametrize('keep_data', [False, True])
+def test_folds_normalised_on_training_subjects(db1_folder, keep_data):
+    subjects = [1, 2, 3]
+    raw = {s: nh.import_db1(db1_folder, s) for s in subjects}
+    folds = list(nh.loso_folds(db1_folder, 1, subjects=subjects, nb_workers=1, keep_data=keep_data))
+
+    assert [fold['test_subject'] for fold in folds] == subjects
+    for fold in folds:
+        train_emg = np.concatenate([raw[s]['emg'][raw[s]['rep'] != 0] for s in fold['train_subjects']])
+        np.testing.assert_allclose(fold['mean'], np.mean(train_emg, axis=0), atol=1e-10)
+        np.testing.assert_allclose(fold['scale'], np.std(train_emg, axis=0), atol=1e-10)
+
+        test_raw = raw[fold['test_subject']]['emg']
+        np.testing.assert_allclose(fold['test']['emg'], (test_raw - fold['mean']) / fold['scale'], atol=1e-5)
+        for subject, data in fold['iter_train']():
+            expected = (raw[subject]['emg'] - fold['mean']) / fold['scale']
+            np.testing.assert_allclose(data['emg'], expected, atol=1e-5)
@@ -0,0 +1,85 @@
+"""Peak memory budgets of the import-normalise-window pipeline, to catch hidden full copies.
+
+Each step runs on a synthetic subject under tracemalloc and its peak allocation is compared to the size of its output.
+Subjects hold around 100MB of float64 EMG so fixed overheads (e.g. chunked normalisation) stay small next to a copy.
+"""
+
+import tracemalloc
+
+import pytest
+
+import nina_helper as nh
+from conftest import write_subject
+
+# Fraction of the real movement/rest durations written for each database (about 100MB of float64 EMG each)
+SCALES = {1: 3.0, 2: 0.25}
+
+# Peak memory allowed for each step as a multiple of its output size, per storage precision (the mat files are
+# float64, so importing at a lower precision needs more headroom relative to its smaller output)
+BUDGETS = {'float64': {'import': 3.0, 'normalise': 0.5, 'windows': 1.25, 'categorical': 1.25},
+           'float32': {'import': 3.75, 'normalise': 0.75, 'windows': 1.25, 'categorical': 1.25},
+           'float16': {'import': 5.5, 'normalise': 1.25, 'windows': 1.25, 'categorical': 1.25}}
+
+
+def traced(func):
+    """Result of func and the peak memory it allocated."""
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture(scope='module', params=[1, 2], ids=['db1', 'db2'])
+def subject(request, tmp_path_factory):
+    """Database and folder of a synthetic subject 1."""
+    folder_path = str(tmp_path_factory.mktemp('db%d' % request.param))
+    write_subject(folder_path, 1, request.param, SCALES[request.param])
+    return request.param, folder_path
+
+
+@pytest.fixture(scope='module', params=sorted(BUDGETS))
+def precision(request):
+    nh.set_precision(request.param)
+    yield request.param
+    nh.set_precision(None)
+
+
+@pytest.fixture(scope='module')
+def data(subject, precision):
+    db, folder_path = subject
+    return nh.import_subject(folder_path, 1, db)
+
+
+def test_import(subject, precision):
+    db, folder_path = subject
+    data, peak = traced(lambda: nh.import_subject(folder_path, 1, db))
+    size = data['emg'].nbytes + data['rep'].nbytes + data['move'].nbytes
+    assert data['emg'].dtype == precision
+    assert peak <= BUDGETS[precision]['import'] * size
+
+
+def test_normalise(subject, precision, data):
+    db = subject[0]
+    train_reps = nh.db_info(db)['rep_labels'][:-2]
+    emg, peak = traced(lambda: nh.normalise_emg(data['emg'], data['rep'], train_reps))
+    assert peak <= BUDGETS[precision]['normalise'] * emg.nbytes
+
+
+def test_windows(subject, precision, data):
+    db = subject[0]
+    window_len = int(0.15 * nh.db_info(db)['fs'])
+    windows, peak = traced(lambda: nh.get_windows(nh.db_info(db)['rep_labels'], window_len, window_len,
+                                                  data['emg'], data['move'], data['rep']))
+    assert windows[0].dtype == precision
+    assert peak <= BUDGETS[precision]['windows'] * sum(x.nbytes for x in windows)
+
+
+def test_categorical(subject, precision, data):
+    db = subject[0]
+    window_len = int(0.15 * nh.db_info(db)['fs'])
+    targets = nh.get_window_targets(nh.db_info(db)['rep_labels'], window_len, window_len, data['move'], data['rep'])
+    labels = data['move'][targets]
+    categorical, peak = traced(lambda: nh.to_categorical(labels))
+    assert peak <= BUDGETS[precision]['categorical'] * categorical.nbytes
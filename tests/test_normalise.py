@@ -0,0 +1,59 @@
+"""Tests for normalise_emg and its cached group moments."""
+
+import numpy as np
+import pytest
+
+import nina_helper as nh
+
+
+@pytest.fixture
+def subject():
+    """Small subject with 6 repetitions of 3 movements separated by rest."""
+    rng = np.random.RandomState(0)
+    rep = np.repeat(np.tile(np.arange(7), 3), 50)
+    move = np.repeat(np.repeat(np.arange(1, 4), 7), 50) * (rep != 0)
+    emg = rng.randn(rep.shape[0], 4) * 3.0 + 2.0 + move[:, None]
+    return emg, rep, move
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    nh.clear_moment_cache()
+    yield
+    nh.clear_moment_cache()
+
+
+def test_cached_matches_uncached(subject):
+    emg, rep, move = subject
+    expected = nh.normalise_emg(emg.copy(), rep, [1, 2, 3], move, [1, 2])
+    cached = nh.normalise_emg(emg, rep, [1, 2, 3], move, [1, 2], cache_key='s1')
+    np.testing.assert_allclose(cached, expected, rtol=0, atol=1e-10)
+
+
+def test_cached_repeated_calls_on_same_array(subject):
+    emg, rep, move = subject
+    raw = emg.copy()
+    for train_reps in ([1, 2, 3], [4, 5, 6], [1, 2, 3]):
+        expected = nh.normalise_emg(raw.copy(), rep, train_reps)
+        cached = nh.normalise_emg(emg, rep, train_reps, cache_key='s1')
+        np.testing.assert_allclose(cached, expected, rtol=0, atol=1e-10)
+        assert cached is not emg
+
+    np.testing.assert_array_equal(emg, raw)
+
+
+def test_uncached_rescales_in_place(subject):
+    emg, rep, _ = subject
+    out = nh.normalise_emg(emg, rep, [1, 2, 3])
+    assert out is emg
+    np.testing.assert_allclose(np.mean(out[np.isin(rep, [1, 2, 3])], axis=0), 0, atol=1e-10)
+    np.testing.assert_allclose(np.std(out[np.isin(rep, [1, 2, 3])], axis=0), 1, atol=1e-10)
+
+
+@pytest.mark.parametrize('cache_key', [None, 's1'])
+def test_empty_training_set_raises(subject, cache_key):
+    emg, rep, move = subject
+    with pytest.raises(ValueError):
+        nh.normalise_emg(emg, rep, [99], cache_key=cache_key)
+    with pytest.raises(ValueError):
+        nh.normalise_emg(emg, rep, [1, 2], move, [99], cache_key=cache_key)
@@ -0,0 +1,51 @@
+"""Tests for precompute_grid and the nina-precompute command."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import nina_helper as nh
+
+
+@pytest.fixture
+def grid_args(db1_folder, tmp_path):
+    return {'folder_path': db1_folder, 'out_path': str(tmp_path), 'db': 1, 'subjects': [1],
+            'window_lens': [10], 'window_incs': [5], 'rest_length_caps': [1]}
+
+
+def test_cells_match_get_windows(grid_args):
+    written = nh.precompute_grid(nb_workers=2, **grid_args)
+    assert written == [os.path.join(grid_args['out_path'], 'S1', 'cap1_len10_inc5')]
+
+    data = nh.import_db1(grid_args['folder_path'], 1, rest_length_cap=1)
+    which_reps = nh.db_info(1)['rep_labels']
+    emg = nh.normalise_emg(data['emg'], data['rep'], which_reps, dtype=np.float32)
+    expected = nh.get_windows(which_reps, 10, 5, emg, data['move'], data['rep'])
+    for name, array in zip('XYR', expected):
+        np.testing.assert_allclose(np.load(os.path.join(written[0], name + '.npy')), array, atol=1e-5)
+
+
+def test_resume_skips_only_matching_cells(grid_args):
+    assert len(nh.precompute_grid(nb_workers=1, **grid_args)) == 1
+    assert nh.precompute_grid(nb_workers=1, **grid_args) == []
+
+    # Other settings write to the same cell path, which is regenerated rather than served stale
+    written = nh.precompute_grid(nb_workers=1, train_reps=[1, 2], dtype=np.float16, layout='NCT', **grid_args)
+    assert len(written) == 1
+    with open(os.path.join(written[0], 'params.json')) as params_file:
+        params = json.load(params_file)
+    assert (params['train_reps'], params['dtype'], params['layout']) == ([1, 2], 'float16', 'NCT')
+    X_data = np.load(os.path.join(written[0], 'X.npy'))
+    assert X_data.dtype == np.float16 and X_data.shape[1:] == (10, 10)
+    assert not any(name.startswith('.') or name.endswith('.partial')
+                   for name in os.listdir(os.path.join(grid_args['out_path'], 'S1')))
+
+
+def test_command_resumes_python_cells(grid_args, capsys):
+    nh.precompute_grid(nb_workers=1, **grid_args)
+    nh.precompute_main([grid_args['folder_path'], grid_args['out_path'], '--db', '1', '--subjects', '1',
+                        '--window-len', '10', '--window-inc', '5', '--rest-length-cap', '1', '--workers', '1'])
+    assert 'Wrote 0 cells' in capsys.readouterr().out
+    assert os.listdir(os.path.join(grid_args['out_path'], 'S1')) == ['cap1_len10_inc5']
@@ -0,0 +1,46 @@
+"""Tests for the ragged per-repetition dataset."""
+
+import numpy as np
+import pytest
+
+import nina_helper as nh
+
+
+@pytest.fixture(scope='module')
+def data(db1_folder):
+    return nh.import_db1(db1_folder, 1, rest_length_cap=1)
+
+
+def test_repetitions_packed_back_to_back(data):
+    dataset = nh.get_rep_dataset(data, which_reps=[1, 3], dtype=np.float64)
+    assert np.all(np.isin(dataset['rep'], [1, 3]))
+    np.testing.assert_array_equal(dataset['offsets'][1:], np.cumsum(dataset['lengths'])[:-1])
+    assert dataset['emg'].shape[0] == np.sum(dataset['lengths'])
+
+    starts = data['rep_regions'][0::2][np.isin(data['rep'][data['rep_regions'][0::2]], [1, 3])]
+    for i, start in enumerate(starts):
+        np.testing.assert_array_equal(nh.rep_sequence(dataset, i),
+                                      data['emg'][start:start + dataset['lengths'][i]])
+
+
+def test_empty_selection(data):
+    dataset = nh.get_rep_dataset(data, which_reps=[99])
+    for key in ('offsets', 'lengths', 'rep', 'move'):
+        assert dataset[key].shape == (0,)
+    assert dataset['emg'].shape == (0, data['emg'].shape[1])
+
+
+@pytest.mark.parametrize('layout', ['NTC', 'NCT'])
+def test_batches_contiguous_and_padded(data, layout):
+    dataset = nh.get_rep_dataset(data, dtype=np.float64)
+    nb_seen = 0
+    for X_batch, lengths, Y_batch, R_batch in nh.iter_rep_batches(dataset, 3, seed=0, layout=layout, pad_value=-9):
+        assert X_batch.flags.c_contiguous
+        assert X_batch.shape[2 if layout == 'NCT' else 1] == np.max(lengths)
+        for x, length, y, r in zip(X_batch, lengths, Y_batch, R_batch):
+            x = x.T if layout == 'NCT' else x
+            i = np.where((dataset['rep'] == r) & (dataset['move'] == y))[0][0]
+            np.testing.assert_array_equal(x[:length], nh.rep_sequence(dataset, i))
+            assert np.all(x[length:] == -9)
+        nb_seen += X_batch.shape[0]
+    assert nb_seen == dataset['lengths'].shape[0]
@@ -0,0 +1,59 @@
+"""Tests for the frequency-domain window features."""
+
+import numpy as np
+import pytest
+from scipy.signal import get_window
+
+import nina_helper as nh
+
+
+@pytest.fixture(scope='module')
+def data(db1_folder):
+    return nh.import_db1(db1_folder, 1, rest_length_cap=1)
+
+
+def naive_features(emg, targets, window_len, fs, bands):
+    """Features computed one window at a time."""
+    freqs = np.fft.rfftfreq(window_len, 1.0 / fs)
+    taper = get_window('hann', window_len)[:, None]
+    features = []
+    for target in targets:
+        window = emg[target - window_len + 1:target + 1] * taper
+        power = np.abs(np.fft.rfft(window, axis=0)) ** 2
+        total = power.sum(axis=0)
+        cum_power = np.cumsum(power, axis=0)
+        median = np.array([freqs[np.argmax(cum_power[:, c] >= total[c] / 2.0)] for c in range(emg.shape[1])])
+        band_powers = [power[(freqs >= low) & (freqs < high)].sum(axis=0) for low, high in bands]
+        features.append(np.stack([freqs @ power / total, median, total, freqs @ power, (freqs ** 2) @ power] +
+                                 band_powers, axis=1))
+    return np.array(features)
+
+
+def test_matches_naive_fft(data):
+    targets = nh.get_window_targets([1, 2], 20, 7, data['move'], data['rep'])
+    bands = [(0, 10), (10, 25), (25, 51)]
+    expected = naive_features(data['emg'], targets, 20, 100, bands)
+    result = nh.spectral_features(data['emg'], targets, 20, 100, bands, dtype=np.float64)
+    np.testing.assert_allclose(result, expected, rtol=1e-10, atol=1e-10)
+
+
+def test_aligned_with_get_windows(data):
+    args = ([3, 1], 20, 7, data['emg'], data['move'], data['rep'])
+    F_data, Y_data, R_data = nh.get_spectral_features(*args, fs=100, which_moves=[0, 2], label='majority')
+    X_data, Y_windows, R_windows = nh.get_windows(*args, which_moves=[0, 2], label='majority')
+    assert F_data.shape[:2] == (X_data.shape[0], X_data.shape[2])
+    np.testing.assert_array_equal(Y_data, Y_windows)
+    np.testing.assert_array_equal(R_data, R_windows)
+
+
+@pytest.mark.parametrize('fs', [100, 2000])
+def test_float16_precision_keeps_moments_finite(data, fs):
+    targets = nh.get_window_targets([1], 20, 7, data['move'], data['rep'])
+    emg = (data['emg'] * 100).astype(np.float16)
+    nh.set_precision(np.float16)
+    try:
+        F_data = nh.spectral_features(emg, targets, 20, fs)
+    finally:
+        nh.set_precision(None)
+    assert F_data.dtype == np.float32
+    assert np.all(np.isfinite(F_data))
@@ -0,0 +1,112 @@
+"""Tests for window selection and labelling."""
+
+import numpy as np
+import pytest
+
+import nina_helper as nh
+
+
+@pytest.fixture(scope='module')
+def data(db1_folder):
+    return nh.import_db1(db1_folder, 1, rest_length_cap=1)
+
+
+@pytest.mark.parametrize('label', ['end', 'majority', 'pure'])
+@pytest.mark.parametrize('which_moves', [None, [0, 3, 1]])
+def test_segments_match_label_scan(data, label, which_moves):
+    which_reps = [2, 1, 5]
+    args = (which_reps, 20, 7, data['emg'], data['move'], data['rep'], which_moves)
+    expected = nh.get_windows(*args, label=label, min_purity=0.8)
+    result = nh.get_windows(*args, label=label, min_purity=0.8, segments=data['segments'])
+
+    assert expected[0].shape[0] > 0
+    for x, y in zip(result, expected):
+        np.testing.assert_array_equal(x, y)
+
+
+def test_balanced_empty_selection(data):
+    X_data, Y_data, R_data = nh.get_windows_balanced([99], 20, 10, data['emg'], data['move'], data['rep'])
+    assert X_data.shape[0] == Y_data.shape[0] == R_data.shape[0] == 0
+
+
+def test_balanced_min_gives_equal_counts(data):
+    X_data, Y_data, R_data = nh.get_windows_balanced([1, 2, 3], 20, 7, data['emg'], data['move'], data['rep'],
+                                                     nb_per_move='min', seed=0)
+    _, counts = np.unique(Y_data, return_counts=True)
+    assert np.all(counts == counts[0])
+
+
+def test_balanced_rest_ratio_caps_rest(data):
+    targets = nh.get_window_targets([1, 2, 3], 20, 7, data['move'], data['rep'])
+    sampled = nh.sample_window_targets(targets, data['move'], nb_per_move=None, rest_ratio=0.5, seed=0)
+    labels = data['move'][sampled]
+    _, move_counts = np.unique(labels[labels != 0], return_counts=True)
+    assert np.sum(labels == 0) == int(round(0.5 * np.mean(move_counts)))
+    assert np.sum(labels != 0) == np.sum(data['move'][targets] != 0)
+
+
+def test_balanced_same_seed_same_selection(data):
+    targets = nh.get_window_targets([1, 2, 3], 20, 7, data['move'], data['rep'])
+    first = nh.sample_window_targets(targets, data['move'], nb_per_move=5, seed=3)
+    np.testing.assert_array_equal(first, nh.sample_window_targets(targets, data['move'], nb_per_move=5, seed=3))
+    assert not np.array_equal(first, nh.sample_window_targets(targets, data['move'], nb_per_move=5, seed=4))
+
+
+def test_balanced_labels_aligned_with_windows(data):
+    X_data, Y_data, R_data = nh.get_windows_balanced([1, 2, 3], 20, 7, data['emg'], data['move'], data['rep'],
+                                                     nb_per_move=5, seed=0)
+    X_all, Y_all, R_all = nh.get_windows([1, 2, 3], 20, 7, data['emg'], data['move'], data['rep'])
+    X_all = X_all.reshape(X_all.shape[0], -1)
+    for x, y, r in zip(X_data, Y_data, R_data):
+        match = np.where(np.all(X_all == x.reshape(-1), axis=1))[0]
+        assert match.shape[0] == 1
+        assert (Y_all[match[0]], R_all[match[0]]) == (y, r)
+
+
+@pytest.mark.parametrize('layout', ['NTC1', 'NCT', 'flat'])
+@pytest.mark.parametrize('label', ['end', 'majority', 'pure'])
+@pytest.mark.parametrize('which_moves', [None, [0, 3, 1]])
+def test_multi_matches_get_windows(data, layout, label, which_moves):
+    configs = [(20, 7), (10, 3), (15, 15)]
+    results = nh.get_windows_multi([2, 1, 5], configs, data['emg'], data['move'], data['rep'], which_moves,
+                                   layout=layout, label=label, min_purity=0.8)
+    for (window_len, window_inc), result in zip(configs, results):
+        X_data, Y_data, R_data = nh.get_windows([2, 1, 5], window_len, window_inc, data['emg'], data['move'],
+                                                data['rep'], which_moves, layout=layout, label=label, min_purity=0.8)
+        np.testing.assert_array_equal(result['windows'][result['idxs']], X_data)
+        np.testing.assert_array_equal(result['Y'], Y_data)
+        np.testing.assert_array_equal(result['R'], R_data)
+
+
+@pytest.mark.parametrize('layout', ['NTC', 'NCT', 'flat'])
+def test_layouts_match_ntc1(data, layout):
+    args = ([1, 2], 20, 7, data['emg'], data['move'], data['rep'])
+    ntc = nh.get_windows(*args)[0][..., 0]
+    X_data = nh.get_windows(*args, layout=layout)[0]
+    expected = {'NTC': ntc, 'NCT': ntc.transpose(0, 2, 1), 'flat': ntc.reshape(ntc.shape[0], -1)}[layout]
+    assert X_data.flags.c_contiguous
+    np.testing.assert_array_equal(X_data, expected)
+
+
+@pytest.mark.parametrize('layout', ['NTC1', 'NCT', 'flat'])
+def test_no_copy_view(data, layout):
+    # Every repetition (rest included) so the windows are evenly spaced
+    emg = np.ascontiguousarray(data['emg'], dtype=np.float32)
+    args = (np.unique(data['rep'])[::-1], 20, 5, emg, data['move'], data['rep'])
+    X_view, Y_view, R_view = nh.get_windows(*args, layout=layout, copy=False)
+    X_data, Y_data, R_data = nh.get_windows(*args, layout=layout)
+
+    assert np.shares_memory(X_view, emg)
+    assert not X_view.flags.writeable
+    targets = nh.get_window_targets(*args[:3], data['move'], data['rep'])
+    order = np.argsort(targets, kind='mergesort')
+    assert np.all(np.diff(targets[order]) > 0)
+    np.testing.assert_array_equal(X_view, X_data[order])
+    np.testing.assert_array_equal(Y_view, Y_data[order])
+    np.testing.assert_array_equal(R_view, R_data[order])
+
+
+def test_no_copy_flat_copies_fortran_emg(data):
+    emg = np.asfortranarray(data['emg'], dtype=np.float32)
+    X_data = nh.get_windows([1, 2], 20, 5, emg, data['move'], data['rep'], layout='flat', copy=False)[0]
+    assert not np.shares_memory(X_data, emg)